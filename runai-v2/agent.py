@@ -1,12 +1,13 @@
 """RunAI Agent - Python 版本 + LangSmith Tracing
-[I N P U T]: 依赖 tools.py 的 tavily_search, google_shopping 工具
-[O U T P U T]: 对外提供 run_agent() 异步函数，返回推荐结果字符串
+[I N P U T]: 依赖 tools.py 的 create_session_tools（local_review_search, tavily_search, google_shopping），session.py 的 ToolSession，prefetch.py 的 PricePrefetcher，budget.py 的 RequestBudget
+[O U T P U T]: 对外提供 run_agent() 异步函数，返回推荐结果字符串；支持单模型 / 分层（快模型规划 + 主模型综合）两种模式
 [P O S]: runai-v2/ 的核心入口，承载 System Prompt + Agent 配置
 [P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
 """
 
 import asyncio
 import textwrap
+import time
 from typing import Any
 from dotenv import load_dotenv
 
@@ -21,8 +22,28 @@ from claude_agent_sdk.types import (
 )
 from langsmith.integrations.claude_agent_sdk import configure_claude_agent_sdk
 
-from tools import tavily_search, google_shopping
-from config import LLM_MODEL, MAX_TURNS, SHOPPING_ENABLED, is_claude_model, logger
+from answers import get_resolver
+from budget import RequestBudget, create_budget_hooks
+from prefetch import PricePrefetcher
+from session import ToolSession
+from tools import create_session_tools
+from tracing import traced_request
+from config import (
+    CORPUS_ENABLED,
+    FAST_MODEL,
+    LLM_MODEL,
+    LANGSMITH_TRACE_MODE,
+    MAX_TURNS,
+    REQUEST_MAX_COST_USD,
+    SYNTHESIS_MAX_TURNS,
+    SYNTHESIS_RESERVE_SECONDS,
+    TIERED_MODE,
+    SHOPPING_ENABLED,
+    SHOPPING_PREFETCH_ENABLED,
+    WEBSEARCH_ENABLED,
+    is_claude_model,
+    logger,
+)
 
 
 # ============================================================
@@ -30,13 +51,16 @@ from config import LLM_MODEL, MAX_TURNS, SHOPPING_ENABLED, is_claude_model, logg
 # ============================================================
 
 load_dotenv()
-configure_claude_agent_sdk()
+# 采样和导出由 tracing.py 的 traced_request 按请求控制，off 时连 SDK 插桩都不装
+if LANGSMITH_TRACE_MODE != "off":
+    configure_claude_agent_sdk()
 
 # System Prompt
 RUNNING_SHOES_PROMPT = textwrap.dedent("""
     你是 RunAI.one，跑鞋研究专家。
 
     ## 工具
+    - **local_review_search**: queries (list[str])，本地评测库，毫秒级，搜索前先查这里；无结果或过旧再上网搜
     - **WebSearch**: 优先使用（如可用），搜索评测和口碑
     - **tavily_search**: queries (list[str] 或单个字符串)，WebSearch 不可用时的备选
     - **google_shopping**: queries (list[str])，查价格和购买链接（如可用）
@@ -96,46 +120,34 @@ RUNNING_SHOES_PROMPT = textwrap.dedent("""
     用中文回复。
     """).strip()
 
+# local_review_search 只在 CORPUS_ENABLED 时注册，关闭时不要让模型去调一个不存在的工具
+if not CORPUS_ENABLED:
+    RUNNING_SHOES_PROMPT = "\n".join(
+        line for line in RUNNING_SHOES_PROMPT.splitlines() if not line.startswith("- **local_review_search**")
+    )
+
 
-def create_ask_user_handler(mock_answers: dict[str, str] | None = None, profile: dict | None = None):
+def create_ask_user_handler(
+    mock_answers: dict[str, str] | None = None,
+    profile: dict | None = None,
+    counts: dict[str, int] | None = None,
+):
     """创建 AskUserQuestion 处理器
 
     Args:
         mock_answers: 预设回答，格式 {"问题关键词": "选项label"}
         profile: 用户画像，用于自动推断回答
+        counts: 传入 dict 时累加各回答策略（mock / profile / profile_raw / default）的命中数
     """
+    # 同一组预设回答 + 画像只编译一次，批量评测时跨会话复用
+    resolver = get_resolver(mock_answers, profile)
+
     async def can_use_tool(
         tool_name: str, input_data: dict, context: ToolPermissionContext
     ) -> PermissionResultAllow:
         if tool_name == "AskUserQuestion":
-            answers = {}
             questions = input_data.get("questions", [])
-
-            for q in questions:
-                question_text = q.get("question", "")
-                header = q.get("header", "")
-                options = q.get("options", [])
-
-                # 策略1: 从 mock_answers 匹配
-                if mock_answers:
-                    for key, value in mock_answers.items():
-                        if key in question_text or key in header:
-                            answers[question_text] = value
-                            logger.info(f"MockAnswer | {header}: {value}")
-                            break
-
-                # 策略2: 从 profile 推断
-                if question_text not in answers and profile:
-                    inferred = infer_answer_from_profile(header, options, profile)
-                    if inferred:
-                        answers[question_text] = inferred
-                        logger.info(f"InferAnswer | {header}: {inferred}")
-
-                # 策略3: 默认选第一个选项
-                if question_text not in answers and options:
-                    answers[question_text] = options[0].get("label", "")
-                    logger.info(f"DefaultAnswer | {header}: {answers[question_text]}")
-
+            answers = resolver.answer_all(questions, counts)
             return PermissionResultAllow(
                 updated_input={"questions": questions, "answers": answers}
             )
@@ -146,40 +158,170 @@ def create_ask_user_handler(mock_answers: dict[str, str] | None = None, profile:
     return can_use_tool
 
 
-def infer_answer_from_profile(header: str, options: list, profile: dict) -> str | None:
-    """根据 profile 推断回答"""
-    header_lower = header.lower()
+# ============================================================
+# 分层执行 - Model Tiering
+# ============================================================
+
+# 规划阶段：快模型负责追问 + 搜索，产出研究简报，不写最终推荐
+PLANNING_PROMPT = RUNNING_SHOES_PROMPT.split("## 输出格式")[0] + textwrap.dedent("""
+    ## 输出格式（研究简报）
+    你只负责澄清需求和搜集证据，最终推荐由另一位专家撰写。输出：
+
+    ### 用户需求
+    用户原话中的信息 + 追问得到的回答（逐条列出）
+
+    ### 需求参数
+    按推理规则推出的关键参数（缓震/稳定/落差/楦型等）
+
+    ### 候选鞋款
+    每款：鞋款名 | 适合理由（引用来源链接）| 已知缺点 | 价格（如有）
 
-    # 映射表：profile 字段 -> 问题 header 关键词
-    mappings = {
-        "weight": ["体重", "weight"],
-        "experience": ["经验", "experience", "人群"],
-        "foot_type": ["脚型", "足弓", "foot"],
-        "pain_point": ["疼痛", "pain", "症状"],
-        "scenario": ["用途", "路面", "场景", "scenario"],
-        "budget": ["预算", "budget", "价格"],
+    ### 避坑
+    不适合该用户的鞋款及原因（引用来源）
+
+    只写搜索到的事实，不要下结论，不要写推荐话术。
+    """).strip()
+
+# 综合阶段：主模型只根据简报写最终推荐
+SYNTHESIS_PROMPT = RUNNING_SHOES_PROMPT + textwrap.dedent("""
+
+    ## 本轮任务
+    需求已由检索助手澄清，证据已整理为研究简报。
+    直接基于简报撰写最终推荐：不要追问，不要搜索；简报没有覆盖的信息如实说明。
+    """).rstrip()
+
+
+# 超时兜底时每条工具结果带进综合阶段的最大字符数
+EVIDENCE_MAX_CHARS = 4000
+
+
+def _tool_result_text(content) -> str:
+    """工具结果可能是字符串或 [{"type": "text", "text": ...}] 列表"""
+    if isinstance(content, list):
+        return "\n".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return str(content or "")
+
+
+def _phase_metrics(model: str) -> dict:
+    return {
+        "model": model,
+        "duration_seconds": 0.0,
+        "cost_usd": 0.0,
+        "num_turns": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
     }
 
-    for profile_key, keywords in mappings.items():
-        if profile_key in profile:
-            for kw in keywords:
-                if kw in header_lower or kw in header:
-                    # 找匹配的选项
-                    profile_value = str(profile[profile_key]).lower()
-                    for opt in options:
-                        label = opt.get("label", "").lower()
-                        desc = opt.get("description", "").lower()
-                        if profile_value in label or profile_value in desc:
-                            return opt.get("label")
-                    # 没找到精确匹配，返回 profile 值让模型理解
-                    return profile[profile_key]
-    return None
+
+async def _run_phase(
+    prompt: str,
+    options: ClaudeAgentOptions,
+    phase: dict,
+    prefetcher: PricePrefetcher | None = None,
+    budget: RequestBudget | None = None,
+    deadline_at: float | None = None,
+    evidence: list[str] | None = None,
+) -> str:
+    """跑一次 query() 消息循环，返回最终文本，并把耗时 / 成本 / token 写入 phase
+
+    deadline_at（事件循环时钟）到达时中止对话，返回已有文本作为尽力而为的结果；
+    传入 evidence 时收集工具结果，超时后交给综合阶段写推荐
+    """
+    result_text = ""
+    started = time.perf_counter()
+
+    async def prompt_stream():
+        yield {
+            "type": "user",
+            "message": {"role": "user", "content": prompt},
+        }
+
+    messages = query(prompt=prompt_stream(), options=options)
+    try:
+        async with asyncio.timeout_at(deadline_at):
+            async for message in messages:
+                msg_type = type(message).__name__
+
+                if msg_type == 'AssistantMessage' and hasattr(message, 'content'):
+                    content = message.content
+                    if budget:
+                        budget.add_usage(getattr(message, 'message_id', None), getattr(message, 'usage', None), content)
+                    if isinstance(content, list):
+                        for block in content:
+                            block_type = type(block).__name__
+                            if hasattr(block, 'text'):
+                                result_text += block.text + "\n"
+                                if prefetcher:
+                                    prefetcher.observe(block.text)
+                                logger.debug("Text | %.200s", block.text)
+                            elif block_type == 'ToolUseBlock':
+                                logger.info("ToolCall | %s → %.100s", block.name, block.input)
+                    elif isinstance(content, str):
+                        result_text += content + "\n"
+                        logger.debug("Text | %.200s", content)
+                elif msg_type == 'UserMessage' and hasattr(message, 'content'):
+                    for block in message.content:
+                        if hasattr(block, 'content'):
+                            # %.200s 在后台线程截断，DEBUG 关闭时不会 str() 整段工具结果
+                            logger.debug("ToolResult | %.200s", block.content)
+                            if evidence is not None:
+                                evidence.append(_tool_result_text(block.content)[:EVIDENCE_MAX_CHARS])
+                elif msg_type == 'ResultMessage':
+                    usage = getattr(message, 'usage', None) or {}
+                    phase["cost_usd"] = getattr(message, 'total_cost_usd', None) or 0.0
+                    phase["num_turns"] = getattr(message, 'num_turns', 0)
+                    phase["input_tokens"] = (
+                        usage.get("input_tokens", 0)
+                        + usage.get("cache_read_input_tokens", 0)
+                        + usage.get("cache_creation_input_tokens", 0)
+                    )
+                    phase["output_tokens"] = usage.get("output_tokens", 0)
+                    if getattr(message, 'result', None):
+                        result_text = message.result
+    except TimeoutError:
+        phase["deadline_hit"] = True
+        if budget:
+            budget.deadline_hit = True
+        logger.warning("Budget | deadline reached after %.1fs, returning best-effort answer", time.perf_counter() - started)
+        # 收集了证据的阶段由调用方补写推荐，提示只加在直接返回给用户的文本上
+        if evidence is None:
+            result_text += "\n\n（已达到本次请求的响应时限，以上为基于已获取信息的部分结果，价格和细节请自行核实）"
+    finally:
+        phase["duration_seconds"] = round(time.perf_counter() - started, 2)
+        try:
+            await messages.aclose()
+        except Exception:
+            pass
+
+    return result_text.strip()
+
+
+async def _synthesize(user_query: str, brief: str, metrics: dict, budget: RequestBudget) -> str:
+    """综合阶段：LLM_MODEL 不调用工具，基于研究简报写最终推荐"""
+    phase = metrics["phases"]["synthesis"] = _phase_metrics(LLM_MODEL)
+    synthesis_options = ClaudeAgentOptions(
+        model=LLM_MODEL,
+        system_prompt=SYNTHESIS_PROMPT,
+        tools=[],
+        max_turns=SYNTHESIS_MAX_TURNS,
+    )
+    return await _run_phase(
+        f"## 用户查询\n{user_query}\n\n## 研究简报\n{brief}",
+        synthesis_options,
+        phase,
+        budget=budget,
+        deadline_at=budget.deadline_at,
+    )
 
 
 async def run_agent(
     user_query: str,
     mock_answers: dict[str, str] | None = None,
     profile: dict | None = None,
+    tiered: bool | None = None,
+    metrics: dict | None = None,
+    budget: RequestBudget | None = None,
+    trace_key: str | None = None,
 ) -> str:
     """Run the RunAI agent with a query
 
@@ -187,22 +329,69 @@ async def run_agent(
         user_query: 用户查询
         mock_answers: 预设追问回答（评测用）
         profile: 用户画像（自动推断回答用）
+        tiered: 分层执行（FAST_MODEL 追问+搜索，LLM_MODEL 写最终推荐），None 时取 TIERED_MODE
+        metrics: 传入 dict 时写入各阶段耗时 / 成本 / token，评测和压测用
+        budget: 本次请求的时限 / 工具调用 / 上游请求 / token 预算，None 时取 REQUEST_* 配置
+        trace_key: LangSmith 采样键（评测传用例 id，同一用例每次采样结果一致），None 时随机采样
     """
+    metrics = metrics if metrics is not None else {}
+    async with traced_request("RunAI", {"query": user_query}, key=trace_key) as trace:
+        result_text = await _run_session(user_query, mock_answers, profile, tiered, metrics, budget)
+        # 超时返回的是部分结果，tail 模式下按失败上报
+        if metrics.get("budget", {}).get("deadline_hit"):
+            trace.mark_failed("deadline")
+        trace.set_outputs({"result": result_text})
+    metrics["traced"] = trace.sampled
+    return result_text
+
+
+async def _run_session(
+    user_query: str,
+    mock_answers: dict[str, str] | None,
+    profile: dict | None,
+    tiered: bool | None,
+    metrics: dict,
+    budget: RequestBudget | None,
+) -> str:
+    """一次完整会话：建工具和预算，跑单模型或 规划 + 综合 两阶段"""
+    tiered = TIERED_MODE if tiered is None else tiered
+    metrics["tiered"] = tiered
+    metrics["phases"] = {}
+
+    # 会话级查询记忆：同一对话内重复的查询不再请求上游
+    session = ToolSession()
+    session_tools = create_session_tools(session)
+    # 请求预算：吃紧时引导模型收尾，用完时拒绝工具调用，到时限直接返回已有结果
+    budget = budget if budget is not None else RequestBudget()
+    budget.start(session)
+    # 助手文本一提到鞋款就后台查价，模型调用 google_shopping 时结果已就绪
+    prefetcher = PricePrefetcher(session) if SHOPPING_ENABLED and SHOPPING_PREFETCH_ENABLED else None
+
+    # 带工具的阶段：单模型模式下是整个对话，分层模式下是规划阶段
+    tool_model = FAST_MODEL if tiered else LLM_MODEL
+
     # Create MCP server with tools
-    tools = [tavily_search]
+    tools = [session_tools["tavily_search"]]
     allowed = ["mcp__running-shoe-tools__tavily_search", "AskUserQuestion"]
 
     # Claude 模型支持 WebSearch，优先使用
-    if is_claude_model():
+    if WEBSEARCH_ENABLED and is_claude_model(tool_model):
         allowed.insert(0, "WebSearch")
-        logger.info(f"Model: {LLM_MODEL} (Claude) → WebSearch enabled")
+        logger.info("Model: %s (Claude) → WebSearch enabled", tool_model)
+    elif not WEBSEARCH_ENABLED:
+        logger.info("Model: %s → WebSearch disabled (WEBSEARCH_ENABLED=0), tavily_search only", tool_model)
     else:
-        logger.info(f"Model: {LLM_MODEL} (non-Claude) → tavily_search only")
+        logger.info("Model: %s (non-Claude) → tavily_search only", tool_model)
 
     if SHOPPING_ENABLED:
-        tools.append(google_shopping)
+        tools.append(session_tools["google_shopping"])
         allowed.insert(1, "mcp__running-shoe-tools__google_shopping")
 
+    # 本地语料库优先，命中时省掉一次网络搜索
+    if CORPUS_ENABLED:
+        tools.insert(0, session_tools["local_review_search"])
+        allowed.insert(0, "mcp__running-shoe-tools__local_review_search")
+
     tools_server = create_sdk_mcp_server(
         name="running-shoe-tools",
         version="1.0.0",
@@ -210,47 +399,50 @@ async def run_agent(
     )
 
     options = ClaudeAgentOptions(
-        model=LLM_MODEL,
-        system_prompt=RUNNING_SHOES_PROMPT,
+        model=tool_model,
+        system_prompt=PLANNING_PROMPT if tiered else RUNNING_SHOES_PROMPT,
         mcp_servers={"running-shoe-tools": tools_server},
         allowed_tools=allowed,
         max_turns=MAX_TURNS,
-        can_use_tool=create_ask_user_handler(mock_answers, profile),
+        can_use_tool=create_ask_user_handler(mock_answers, profile, metrics.setdefault("clarification", {})),
+        hooks=create_budget_hooks(budget),
+        max_budget_usd=REQUEST_MAX_COST_USD,
     )
 
-    result_text = ""
-
-    async def prompt_stream():
-        yield {
-            "type": "user",
-            "message": {"role": "user", "content": user_query},
-        }
-
-    async for message in query(prompt=prompt_stream(), options=options):
-        msg_type = type(message).__name__
-
-        if msg_type == 'AssistantMessage' and hasattr(message, 'content'):
-            content = message.content
-            if isinstance(content, list):
-                for block in content:
-                    block_type = type(block).__name__
-                    if hasattr(block, 'text'):
-                        result_text += block.text + "\n"
-                        logger.debug(f"Text | {block.text[:200]}..." if len(block.text) > 200 else f"Text | {block.text}")
-                    elif block_type == 'ToolUseBlock':
-                        logger.info(f"ToolCall | {block.name} → {str(block.input)[:100]}")
-            elif isinstance(content, str):
-                result_text += content + "\n"
-                logger.debug(f"Text | {content}")
-        elif msg_type == 'UserMessage' and hasattr(message, 'content'):
-            for block in message.content:
-                if hasattr(block, 'content'):
-                    result_content = str(block.content)[:200]
-                    logger.debug(f"ToolResult | {result_content}...")
-        elif msg_type == 'ResultMessage' and hasattr(message, 'result') and message.result:
-            result_text = message.result
+    try:
+        # 带工具的阶段提前结束，给不调用工具的综合阶段留出 SYNTHESIS_RESERVE_SECONDS
+        tool_deadline = budget.deadline_at
+        if tool_deadline is not None:
+            tool_deadline -= min(SYNTHESIS_RESERVE_SECONDS, budget.deadline_seconds / 2)
+
+        if not tiered:
+            phase = metrics["phases"]["single"] = _phase_metrics(LLM_MODEL)
+            evidence: list[str] = []
+            result_text = await _run_phase(user_query, options, phase, prefetcher, budget, tool_deadline, evidence)
+            # 时限前没写完推荐：已有的只是中间叙述，用预留时间基于收集到的工具结果补写一轮
+            if phase.get("deadline_hit"):
+                brief = "\n\n".join([result_text, *evidence])
+                result_text = await _synthesize(user_query, brief, metrics, budget)
+        else:
+            phase = metrics["phases"]["plan"] = _phase_metrics(FAST_MODEL)
+            brief = await _run_phase(user_query, options, phase, prefetcher, budget, tool_deadline)
+            result_text = await _synthesize(user_query, brief, metrics, budget)
+    finally:
+        if prefetcher:
+            prefetcher.close()
+        session.close()
+        metrics["tools"] = session.summary()
+        metrics["budget"] = budget.snapshot()
+        for name, phase in metrics["phases"].items():
+            logger.info(
+                "Phase | %s model=%s %.1fs $%.4f turns=%s tokens=%s/%s",
+                name, phase['model'], phase['duration_seconds'], phase['cost_usd'],
+                phase['num_turns'], phase['input_tokens'], phase['output_tokens'],
+            )
+        logger.info("SessionMemo | summary %s", metrics['tools'])
+        logger.info("Budget | summary %s", metrics['budget'])
 
-    return result_text.strip()
+    return result_text
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+"""RunAI 追踪开销基准 - 对比 关闭 / 采样 / 全量 / 只留失败和慢请求 的单会话开销
+[I N P U T]: 依赖 tracing.py 的 traced_request / TraceExporter，langsmith 的 trace
+[O U T P U T]: 每种模式的单会话耗时分位数、相对同轮 off 的开销中位数、导出 / 丢弃的 trace 数、内存峰值，写入 JSON
+[P O S]: runai-v2/ 的可观测性基准，用模拟会话（与真实会话同形状的 run 树）和计数 sink，不需要 API key
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from langsmith import trace
+
+from loadtest import EVAL_DIR, percentile
+from tracing import TraceExporter, traced_request
+
+# (模式名, trace_mode, sample_rate)
+MODES = [
+    ("off", "off", 1.0),
+    ("sampled-10%", "all", 0.1),
+    ("tail", "tail", 1.0),
+    ("all", "all", 1.0),
+]
+
+
+class CountingSink:
+    """代替 LangSmith Client：只计数，每次调用按 latency 模拟网络耗时（发生在导出线程里）"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.runs = 0
+
+    def create_run(self, **kwargs):
+        self._call()
+
+    def update_run(self, **kwargs):
+        self._call()
+
+    def _call(self):
+        self.runs += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def simulated_session(turns: int, tools_per_turn: int, payload: str):
+    """与 run_agent 一次会话同形状的 run 树：每轮一个 llm run + 若干 tool run
+
+    用同步的 with trace(...)：async with 每次进出都会经 aio_to_thread 切线程，
+    这部分在所有模式下都有，会把模式间的差异淹没在调度抖动里
+    """
+    for t in range(turns):
+        with trace("claude.assistant.turn", run_type="llm", inputs={"turn": t}) as llm:
+            llm.end(outputs={"content": payload})
+        for k in range(tools_per_turn):
+            with trace("tavily_search", run_type="tool", inputs={"query": f"q{t}-{k}"}) as tool:
+                tool.end(outputs={"result": payload})
+
+
+async def run_batch(mode: str, rate: float, exporter: TraceExporter, args: argparse.Namespace,
+                    offset: int) -> tuple[list[float], int]:
+    """跑一批会话，返回 (每个会话的耗时, 内存峰值 bytes)"""
+    payload = "x" * args.payload_chars
+    durations = []
+    # tracemalloc 本身会拖慢分配，只在 --memory 时开启
+    if args.memory:
+        tracemalloc.start()
+    for i in range(offset, offset + args.sessions):
+        started = time.perf_counter()
+        try:
+            async with traced_request("RunAI", {"query": f"bench {i}"}, key=f"case-{i}",
+                                      mode=mode, rate=rate, slow_seconds=float("inf"), exporter=exporter) as handle:
+                simulated_session(args.turns, args.tools_per_turn, payload)
+                if i % args.fail_every == 0:
+                    handle.mark_failed("bench")
+        finally:
+            durations.append(time.perf_counter() - started)
+    peak = 0
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return durations, peak
+
+
+async def main(args: argparse.Namespace):
+    print(f"\n{'#'*60}")
+    print(f"# 追踪开销基准 - 每种模式 {args.repeats} 轮 × {args.sessions} 个模拟会话 "
+          f"({args.turns} 轮 × {args.tools_per_turn} 工具, 每 {args.fail_every} 个失败 1 个)")
+    print(f"{'#'*60}\n")
+
+    sinks = {name: CountingSink(args.sink_latency) for name, _, _ in MODES}
+    exporters = {
+        name: TraceExporter(client_factory=lambda sink=sinks[name]: sink, max_queue=args.queue_size)
+        for name, _, _ in MODES
+    }
+    durations: dict[str, list[float]] = {name: [] for name, _, _ in MODES}
+    batch_means: dict[str, list[float]] = {name: [] for name, _, _ in MODES}
+    peaks: dict[str, int] = dict.fromkeys(durations, 0)
+
+    # 预热一次，避免首个模式承担 import / 首次分配的开销
+    async with traced_request("warmup", {}, mode="off"):
+        simulated_session(1, 1, "")
+
+    # 各模式交替跑多轮，每轮内再打乱顺序，机器状态的漂移平均分摊到所有模式
+    rng = random.Random(args.seed)
+    for r in range(args.repeats):
+        order = list(MODES)
+        rng.shuffle(order)
+        for name, mode, rate in order:
+            batch, peak = await run_batch(mode, rate, exporters[name], args, r * args.sessions)
+            durations[name].extend(batch)
+            batch_means[name].append(sum(batch) / len(batch))
+            peaks[name] = max(peaks[name], peak)
+
+    results = {}
+    for name, _, _ in MODES:
+        exporter = exporters[name]
+        backlog = exporter.pending
+        exporter.close(timeout=args.flush_timeout)
+        d = durations[name]
+        # 每轮与同轮 off 的差，取中位数
+        deltas = [m - base for m, base in zip(batch_means[name], batch_means["off"])]
+        results[name] = {
+            "sessions": len(d),
+            "mean_us": round(sum(d) / len(d) * 1e6, 1),
+            "p50_us": round(percentile(d, 50) * 1e6, 1),
+            "p99_us": round(percentile(d, 99) * 1e6, 1),
+            "median_delta_us": round(statistics.median(deltas) * 1e6, 1),
+            "traces_submitted": exporter.stats["submitted"],
+            "traces_dropped": exporter.stats["dropped"],
+            "runs_exported": sinks[name].runs,
+            "backlog_at_end": backlog,
+            "peak_alloc_kb": round(peaks[name] / 1024, 1),
+        }
+
+    print(f"{'Mode':<12} {'Mean(us)':>9} {'p50(us)':>8} {'p99(us)':>8} {'Sent':>6} {'Drop':>6} {'Runs':>7} {'Peak(KB)':>9}")
+    print("─" * 72)
+    for name, r in results.items():
+        print(f"{name:<12} {r['mean_us']:>9.1f} {r['p50_us']:>8.1f} {r['p99_us']:>8.1f} "
+              f"{r['traces_submitted']:>6} {r['traces_dropped']:>6} {r['runs_exported']:>7} {r['peak_alloc_kb']:>9.1f}")
+
+    print(f"\n单会话额外开销（相对同轮 off，{args.repeats} 轮的中位数）:")
+    for name, r in results.items():
+        if name != "off":
+            print(f"  {name:<12} {r['median_delta_us']:+.1f} us")
+
+    output_path = Path(args.output_dir) / f"bench_tracing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"params": vars(args), "modes": results}, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output_path}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="RunAI LangSmith 追踪开销基准")
+    parser.add_argument("--sessions", type=int, default=100, help="每种模式每轮的会话数")
+    parser.add_argument("--repeats", type=int, default=5, help="轮数，各模式在每轮内交替运行")
+    parser.add_argument("--seed", type=int, default=0, help="每轮模式顺序的随机种子")
+    parser.add_argument("--turns", type=int, default=8, help="每个会话的模型轮次")
+    parser.add_argument("--tools-per-turn", type=int, default=2, help="每轮的工具调用数")
+    parser.add_argument("--payload-chars", type=int, default=4000, help="每个 run 输出的字符数")
+    parser.add_argument("--fail-every", type=int, default=20, help="每 N 个会话标记 1 个失败（tail 模式只导出这些）")
+    parser.add_argument("--queue-size", type=int, default=200, help="导出队列上限（trace 数）")
+    parser.add_argument("--sink-latency", type=float, default=0.001, help="模拟的每次上报耗时（秒）")
+    parser.add_argument("--flush-timeout", type=float, default=5.0, help="每种模式结束后等待导出的时间（秒）")
+    parser.add_argument("--memory", action="store_true", help="用 tracemalloc 记录内存峰值（会放大耗时）")
+    parser.add_argument("--output-dir", default=str(EVAL_DIR / "results"), help="结果目录")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
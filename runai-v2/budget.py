@@ -0,0 +1,181 @@
+"""RunAI 请求预算 - 时限 / 工具调用 / 上游请求 / token 上限
+[I N P U T]: config.py 的 REQUEST_* 预算配置，session.py 的 ToolSession（上游请求计数）
+[O U T P U T]: 对外提供 RequestBudget, create_budget_hooks()
+[P O S]: runai-v2/ 的尾延迟控制层，run_agent 消息循环记 token，PreToolUse / PostToolUse hook 记工具调用并引导收尾
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from claude_agent_sdk import HookMatcher
+
+from config import (
+    BUDGET_LOW_WATERMARK,
+    REQUEST_DEADLINE_SECONDS,
+    REQUEST_MAX_TOOL_CALLS,
+    REQUEST_MAX_UPSTREAM_REQUESTS,
+    REQUEST_MAX_TOKENS,
+    logger,
+)
+from session import ToolSession
+
+BUDGET_LOW_NOTICE = (
+    "⚠️ 本次请求预算即将用完（{reason}）。请停止扩展搜索，"
+    "最多再补一次关键查询，然后基于已有证据输出最终推荐。"
+)
+BUDGET_EXHAUSTED_NOTICE = (
+    "预算已用完（{reason}），该工具调用被拒绝。"
+    "不要再调用任何工具，立即基于已有证据输出最终推荐，并说明哪些信息未能核实。"
+)
+
+
+@dataclass
+class RequestBudget:
+    """单次请求的预算，None 表示该维度不限
+
+    用量达到 low_watermark 时引导模型收尾，达到 100% 时拒绝继续调用工具；
+    时限由 run_agent 用 asyncio.timeout_at 硬性执行
+    """
+    deadline_seconds: float | None = REQUEST_DEADLINE_SECONDS
+    max_tool_calls: int | None = REQUEST_MAX_TOOL_CALLS
+    max_upstream_requests: int | None = REQUEST_MAX_UPSTREAM_REQUESTS
+    max_tokens: int | None = REQUEST_MAX_TOKENS
+    low_watermark: float = BUDGET_LOW_WATERMARK
+
+    tool_calls: int = 0
+    tokens: int = 0
+    deadline_hit: bool = False
+    denied_tool_calls: int = 0
+    _started: float = field(default=0.0, repr=False)
+    _deadline_at: float | None = field(default=None, repr=False)
+    _session: ToolSession | None = field(default=None, repr=False)
+    _message_tokens: dict[str, int] = field(default_factory=dict, repr=False)
+
+    def start(self, session: ToolSession | None = None):
+        """在事件循环内开始计时，绑定会话以读取上游请求数"""
+        self._started = time.perf_counter()
+        if self.deadline_seconds is not None:
+            self._deadline_at = asyncio.get_running_loop().time() + self.deadline_seconds
+        self._session = session
+
+    @property
+    def deadline_at(self) -> float | None:
+        """事件循环时钟上的截止时刻，供 asyncio.timeout_at 使用"""
+        return self._deadline_at
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started if self._started else 0.0
+
+    @property
+    def upstream_requests(self) -> int:
+        return self._session.upstream_requests if self._session else 0
+
+    def _ratios(self) -> dict[str, float]:
+        ratios = {}
+        if self.deadline_seconds:
+            ratios["deadline"] = self.elapsed / self.deadline_seconds
+        if self.max_tool_calls:
+            ratios["tool_calls"] = self.tool_calls / self.max_tool_calls
+        if self.max_upstream_requests:
+            ratios["upstream_requests"] = self.upstream_requests / self.max_upstream_requests
+        if self.max_tokens:
+            ratios["tokens"] = self.tokens / self.max_tokens
+        return ratios
+
+    def pressure(self) -> tuple[float, str]:
+        """最紧张的维度及其用量比例"""
+        ratios = self._ratios()
+        if not ratios:
+            return 0.0, ""
+        name = max(ratios, key=ratios.get)
+        return ratios[name], name
+
+    @property
+    def low(self) -> bool:
+        return self.pressure()[0] >= self.low_watermark
+
+    @property
+    def exhausted(self) -> bool:
+        return self.pressure()[0] >= 1.0
+
+    def add_usage(self, message_id: str | None, usage: dict | None, content=None):
+        """记录一条助手消息的 token
+
+        CLI 每个内容块发一条 AssistantMessage，同一次调用的 message_id 和 usage 相同，按 message_id 只记一次
+        （后到的 usage 覆盖先前的值）。缓存读取是每轮重读的上下文，不计入，否则 token 随轮数平方增长；
+        SDK 没有返回 usage 时才按 4 字符 1 token 估算这条消息的 content
+        """
+        previous = self._message_tokens.get(message_id, 0)
+        if usage:
+            tokens = (
+                usage.get("input_tokens", 0)
+                + usage.get("cache_creation_input_tokens", 0)
+                + usage.get("output_tokens", 0)
+            )
+        elif isinstance(content, str):
+            tokens = previous + len(content) // 4
+        else:
+            tokens = previous + sum(len(getattr(block, "text", "") or "") for block in content or []) // 4
+        self.tokens += tokens - previous
+        if message_id is not None:
+            self._message_tokens[message_id] = tokens
+
+    def snapshot(self) -> dict:
+        ratio, name = self.pressure()
+        return {
+            "elapsed_seconds": round(self.elapsed, 2),
+            "deadline_seconds": self.deadline_seconds,
+            "tool_calls": self.tool_calls,
+            "max_tool_calls": self.max_tool_calls,
+            "upstream_requests": self.upstream_requests,
+            "prefetch_requests": self._session.prefetch_requests if self._session else 0,
+            "max_upstream_requests": self.max_upstream_requests,
+            "tokens": self.tokens,
+            "max_tokens": self.max_tokens,
+            "pressure": round(ratio, 3),
+            "tightest": name,
+            "denied_tool_calls": self.denied_tool_calls,
+            "deadline_hit": self.deadline_hit,
+        }
+
+
+def create_budget_hooks(budget: RequestBudget) -> dict[str, list[HookMatcher]]:
+    """预算 hook：
+
+    - PreToolUse: 记录工具调用次数；预算用完时拒绝调用，理由里要求模型立即收尾
+    - PostToolUse: 预算吃紧时在工具结果后追加提示，引导模型停止扩展搜索
+    """
+    async def pre_tool_use(input_data, tool_use_id, context):
+        if not budget.exhausted:
+            budget.tool_calls += 1
+            return {}
+        _, reason = budget.pressure()
+        budget.denied_tool_calls += 1
+        logger.warning("Budget | deny %s (%s exhausted)", input_data.get('tool_name'), reason)
+        return {
+            "hookSpecificOutput": {
+                "hookEventName": "PreToolUse",
+                "permissionDecision": "deny",
+                "permissionDecisionReason": BUDGET_EXHAUSTED_NOTICE.format(reason=reason),
+            }
+        }
+
+    async def post_tool_use(input_data, tool_use_id, context):
+        if not budget.low:
+            return {}
+        ratio, reason = budget.pressure()
+        logger.info("Budget | low (%s %.0f%%), steering to finish", reason, ratio * 100)
+        return {
+            "hookSpecificOutput": {
+                "hookEventName": "PostToolUse",
+                "additionalContext": BUDGET_LOW_NOTICE.format(reason=f"{reason} {ratio:.0%}"),
+            }
+        }
+
+    return {
+        "PreToolUse": [HookMatcher(matcher=None, hooks=[pre_tool_use])],
+        "PostToolUse": [HookMatcher(matcher=None, hooks=[post_tool_use])],
+    }
@@ -0,0 +1,157 @@
+"""RunAI 上游结果缓存 - TTL 缓存 + 热度统计 + 提前刷新
+[I N P U T]: 无外部依赖，刷新函数由 tools.py 注入
+[O U T P U T]: 对外提供 TTLCache, RateLimiter, RefreshAheadWarmer
+[P O S]: runai-v2/ 的缓存层，tools.py 在请求路径上读写，预热任务在后台刷新热门条目
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from config import logger
+
+
+class TTLCache:
+    """带过期时间和访问热度的 LRU 缓存
+
+    热度按访问次数累计，预热任务每轮衰减一次，只反映近期的热门查询；
+    只统计在缓存里的 key（未命中且没写入的 key 不留记录，淘汰时一并清掉），热度表不超过 max_entries
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._hits: dict[Hashable, float] = {}
+        self.stats = {"hit": 0, "miss": 0, "refresh": 0}
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats["miss"] += 1
+            return None
+        self._hits[key] = self._hits.get(key, 0.0) + 1
+        if entry[0] <= time.monotonic():
+            self.stats["miss"] += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats["hit"] += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        # 新 key 记上触发这次写入的那次未命中；预热刷新已有 key 时不改热度
+        self._hits.setdefault(key, 1.0)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            evicted, _ = self._data.popitem(last=False)
+            self._hits.pop(evicted, None)
+
+    def expiring(self, within: float, top_k: int) -> list[Hashable]:
+        """热度前 top_k 且将在 within 秒内过期（或刚过期）的 key"""
+        deadline = time.monotonic() + within
+        popular = sorted(self._hits.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        return [key for key, _ in popular if key in self._data and self._data[key][0] <= deadline]
+
+    def decay(self, factor: float):
+        """热度衰减，并清掉已经不热的 key（热度不足半次访问）"""
+        self._hits = {k: v * factor for k, v in self._hits.items() if v * factor >= 0.5}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RateLimiter:
+    """令牌桶限流，rate 为每秒令牌数"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RefreshAheadWarmer:
+    """后台刷新热门缓存条目，赶在过期前把新结果写回
+
+    每轮取热度前 top_k、剩余寿命不足 window 比例 TTL 的条目刷新；
+    刷新经过独立的 RateLimiter，只占用上游配额的一部分，不与请求路径抢额度；
+    一次刷新会发出多个上游请求时传 limiter=None，由刷新函数按实际请求自行取令牌。
+    热度每 half_life 个 TTL 减半，按轮询间隔折算成每轮的衰减系数
+    """
+
+    def __init__(
+        self,
+        cache: TTLCache,
+        refresh: Callable[[Hashable], Awaitable[Any | None]],
+        limiter: RateLimiter | None,
+        top_k: int,
+        window: float,
+        interval: float,
+        half_life: float = 0.5,
+    ):
+        self.cache = cache
+        self.refresh = refresh
+        self.limiter = limiter
+        self.top_k = top_k
+        self.window = window
+        self.interval = interval
+        self.decay = 0.5 ** (interval / (cache.ttl * half_life))
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh_due(self) -> int:
+        """刷新一轮，返回成功刷新的条目数"""
+        refreshed = 0
+        for key in self.cache.expiring(self.cache.ttl * self.window, self.top_k):
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            try:
+                value = await self.refresh(key)
+            except Exception as e:
+                logger.warning("Warmer | %s refresh failed for %r: %s", self.cache.name, key, e)
+                continue
+            if value is not None:
+                self.cache.set(key, value)
+                self.cache.stats["refresh"] += 1
+                refreshed += 1
+        return refreshed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            refreshed = await self.refresh_due()
+            if refreshed:
+                logger.info("Warmer | %s refreshed %d entries", self.cache.name, refreshed)
+            self.cache.decay(self.decay)
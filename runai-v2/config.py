@@ -4,6 +4,7 @@
 """
 
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,17 +15,55 @@ load_dotenv()
 LLM_MODEL = os.environ.get("LLM_MODEL", "claude-sonnet-4-5-20250929")
 MAX_TURNS = 15
 
+# 分层执行：快模型负责追问和搜索规划，主模型只写最终推荐
+FAST_MODEL = os.environ.get("FAST_MODEL", "claude-haiku-4-5")
+TIERED_MODE = os.environ.get("TIERED_MODE", "0") == "1"
+SYNTHESIS_MAX_TURNS = 2  # 综合阶段不调用工具，一轮即可输出
+
+def _env_number(name: str, default, cast=float):
+    """读取数值型环境变量，"none" / "0" 表示不限"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    if value.lower() in ("", "none", "0"):
+        return None
+    return cast(value)
+
+# ============================================================
+# 单次请求预算（None 表示不限）
+# ============================================================
+REQUEST_DEADLINE_SECONDS = _env_number("REQUEST_DEADLINE_SECONDS", None)      # 墙钟时限，默认不限（压测 / 线上服务按需开启）
+REQUEST_MAX_TOOL_CALLS = _env_number("REQUEST_MAX_TOOL_CALLS", 12, int)         # 工具调用次数
+REQUEST_MAX_UPSTREAM_REQUESTS = _env_number("REQUEST_MAX_UPSTREAM_REQUESTS", 40, int)  # Tavily / SerpAPI 请求数
+REQUEST_MAX_TOKENS = _env_number("REQUEST_MAX_TOKENS", 400_000, int)           # 未缓存输入 + 输出 token（缓存读取不计）
+REQUEST_MAX_COST_USD = _env_number("REQUEST_MAX_COST_USD", None)               # 交给 SDK 的 max_budget_usd
+BUDGET_LOW_WATERMARK = 0.75         # 任一维度用到 75% 即引导模型收尾
+SYNTHESIS_RESERVE_SECONDS = 30.0    # 开启时限时给不调用工具的综合阶段预留的时间
+
 def is_claude_model(model: str = LLM_MODEL) -> bool:
     """判断是否是 Claude 模型（支持 WebSearch）"""
     return model.startswith("claude-")
 
+# Claude 模型默认允许服务端 WebSearch；压测时关掉，让搜索流量都走 tavily_search（本地替身）
+WEBSEARCH_ENABLED = os.environ.get("WEBSEARCH_ENABLED", "1") == "1"
+
 # ============================================================
 # Tavily 搜索配置
 # ============================================================
+TAVILY_API_URL = os.environ.get("TAVILY_API_URL", "https://api.tavily.com/search")  # 压测时指向本地替身
 TAVILY_CONCURRENCY = 4  # 并发查询数
 TAVILY_TIMEOUT = 30.0   # 单次请求超时（秒）
 TAVILY_MAX_RESULTS = 5  # 每次搜索返回结果数
 
+# 搜索后端（search_backends.py）：tavily_search 按顺序 / 竞速分发到这些后端
+# tavily：Tavily API；standin：兼容 Tavily 格式的本地 HTTP 服务；corpus：本地评测语料库
+SEARCH_BACKENDS = [b.strip() for b in os.environ.get("SEARCH_BACKENDS", "tavily").split(",") if b.strip()]
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "fallback")  # fallback：主备；race：前 N 个同时请求，先到的足够结果胜出
+SEARCH_RACE_N = 2             # race 模式同时请求的后端数
+SEARCH_MIN_RESULTS = 3        # 结果数达到这个值才算"足够"，否则继续尝试下一个后端
+SEARCH_BACKEND_TIMEOUT = TAVILY_TIMEOUT
+SEARCH_STANDIN_URL = os.environ.get("SEARCH_STANDIN_URL", "")  # standin 后端地址，如 http://127.0.0.1:8765/search
+
 # 高优先级来源
 TAVILY_HIGH_PRIORITY_SOURCES = [
     # 专业评测（英文）
@@ -48,16 +87,58 @@ TAVILY_HIGH_PRIORITY_SOURCES = [
 # Google Shopping 配置（暂时禁用，SerpAPI 配额用完）
 # ============================================================
 SHOPPING_ENABLED = False  # 是否启用 Google Shopping
+SERPAPI_URL = os.environ.get("SERPAPI_URL", "https://serpapi.com/search")  # 压测时指向本地替身
 SHOPPING_CONCURRENCY = 2  # 并发查询数（降低以减少 429）
 SHOPPING_TIMEOUT = 30.0   # 单次请求超时（秒）
 SHOPPING_RETRY_ATTEMPTS = 2  # 重试次数
 SHOPPING_RETRY_DELAY = 2.0   # 重试初始延迟（秒）
 SHOPPING_MAX_PRODUCTS = 3    # 每个查询返回产品数
+SHOPPING_PREFETCH_ENABLED = True  # 助手文本提到鞋款时提前查价（仅 SHOPPING_ENABLED 时生效）
+SHOPPING_PREFETCH_MAX = 4         # 每次对话最多预取的鞋款数，控制 SerpAPI 配额
+
+# ============================================================
+# 本地评测语料库（SQLite FTS5）
+# ============================================================
+CORPUS_ENABLED = os.environ.get("CORPUS_ENABLED", "1") == "1"
+CORPUS_PATH = os.environ.get("CORPUS_PATH", str(Path(__file__).parent / "data" / "review_corpus.db"))
+CORPUS_MAX_RESULTS = 8       # 每个查询返回片段数
+CORPUS_MAX_AGE_DAYS = 180    # 超过这个天数的片段不再返回（跑鞋迭代快）
+
+# ============================================================
+# 工具输出格式
+# ============================================================
+# compact: 精简文本，减少后续每轮重复读取的 prompt token；verbose: 原 markdown 格式，调试用
+TOOL_OUTPUT_FORMAT = os.environ.get("TOOL_OUTPUT_FORMAT", "compact")
+
+# ============================================================
+# 缓存 & 提前刷新配置
+# ============================================================
+TAVILY_CACHE_TTL = 6 * 3600     # 搜索结果缓存（秒）
+SHOPPING_CACHE_TTL = 3600       # 价格变动快，缓存短一些（秒）
+CACHE_MAX_ENTRIES = 2000        # 每类缓存最大条目数
+
+REFRESH_AHEAD_ENABLED = os.environ.get("REFRESH_AHEAD_ENABLED", "1") == "1"
+REFRESH_AHEAD_TOP_K = 20        # 每轮最多刷新的热门条目数
+REFRESH_AHEAD_WINDOW = 0.2      # 剩余寿命不足 TTL 的 20% 时刷新
+REFRESH_AHEAD_INTERVAL = 60.0   # 预热轮询间隔（秒）
+REFRESH_POPULARITY_HALF_LIFE = 0.5  # 热度半衰期（TTL 的倍数）：只访问一次的 key 半个 TTL 后被遗忘，两次以上才会被预热
+
+# 上游限流（每分钟请求数），预热只用其中 REFRESH_QUOTA_SHARE 的份额
+TAVILY_RATE_LIMIT_PER_MIN = 100
+SHOPPING_RATE_LIMIT_PER_MIN = 30
+REFRESH_QUOTA_SHARE = 0.2
 
 # ============================================================
 # LangSmith 配置
 # ============================================================
 LANGSMITH_PROJECT = os.environ.get("LANGCHAIN_PROJECT", "runai-eval")
+# all：采样到的请求全部上报；tail：只上报失败 / 慢请求；off：不追踪
+LANGSMITH_TRACE_MODE = os.environ.get("LANGSMITH_TRACE_MODE", "all")
+LANGSMITH_SAMPLE_RATE = float(os.environ.get("LANGSMITH_SAMPLE_RATE", "1.0"))  # 按请求采样，评测按用例 id 固定
+LANGSMITH_SLOW_SECONDS = float(os.environ.get("LANGSMITH_SLOW_SECONDS", "120"))  # tail 模式下的慢请求阈值
+LANGSMITH_EXPORT_QUEUE_SIZE = 200     # 待导出 trace 上限，满了丢弃，内存不随负载增长
+LANGSMITH_MAX_RUNS_PER_TRACE = 2000   # 单个 trace 缓冲的 run 事件上限
+LANGSMITH_FLUSH_TIMEOUT = 10.0        # 进程退出时等待导出完成的时间（秒）
 
 # ============================================================
 # 日志配置
@@ -66,12 +147,24 @@ import logging
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 LOG_FORMAT = "[%(levelname)s] %(message)s"
+LOG_OUTPUT = os.environ.get("LOG_OUTPUT", "text")  # "text" | "json"（一行一个 JSON，便于采集）
+LOG_QUEUE_SIZE = 10000  # 日志队列上限，满了直接丢弃，不阻塞事件循环
+# 高频 debug 事件的采样比例（按消息模板 " | " 前的事件名匹配）
+LOG_SAMPLE_RATES = {
+    "Text": float(os.environ.get("LOG_SAMPLE_TEXT", "0.2")),
+    "ToolResult": float(os.environ.get("LOG_SAMPLE_TOOL_RESULT", "0.2")),
+}
 
 def setup_logging():
-    """配置全局日志"""
-    logging.basicConfig(
+    """配置全局日志：队列 + 后台线程输出，调用方不做格式化和 IO（见 logpipe.py）"""
+    from logpipe import install_pipeline
+
+    install_pipeline(
         level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
-        format=LOG_FORMAT,
+        fmt=LOG_OUTPUT,
+        text_format=LOG_FORMAT,
+        sample_rates=LOG_SAMPLE_RATES,
+        queue_size=LOG_QUEUE_SIZE,
     )
     return logging.getLogger("runai")
 
@@ -0,0 +1,145 @@
+"""RunAI 本地评测语料库 - SQLite FTS5 + BM25
+[I N P U T]: tools.py 检索到的 SearchResult 记录，config.py 的 CORPUS_* 配置
+[O U T P U T]: 对外提供 ReviewCorpus, get_corpus(), is_priority_source()
+[P O S]: runai-v2/ 的本地证据层，积累历次搜索的评测片段，供 local_review_search 毫秒级离线查询
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import CORPUS_PATH, TAVILY_HIGH_PRIORITY_SOURCES, logger
+from records import SearchHit, SearchResult
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snippets (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    title TEXT NOT NULL,
+    snippet TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS snippets_fts USING fts5(
+    title, snippet, content='snippets', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS snippets_ai AFTER INSERT ON snippets BEGIN
+    INSERT INTO snippets_fts(rowid, title, snippet) VALUES (new.id, new.title, new.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS snippets_ad AFTER DELETE ON snippets BEGIN
+    INSERT INTO snippets_fts(snippets_fts, rowid, title, snippet) VALUES ('delete', old.id, old.title, old.snippet);
+END;
+"""
+
+# 高优先级来源的 BM25 加权（bm25() 越小越相关，乘以 >1 的系数即提升排名）
+PRIORITY_BOOST = 1.5
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_priority_source(url: str) -> bool:
+    """URL 是否来自 TAVILY_HIGH_PRIORITY_SOURCES（支持 reddit.com/r/xxx 这类带路径的来源）"""
+    bare = re.sub(r"^https?://(www\.)?", "", url.lower())
+    return any(bare.startswith(source.lower()) for source in TAVILY_HIGH_PRIORITY_SOURCES)
+
+
+def _snippet_hash(url: str, snippet: str) -> str:
+    normalized = " ".join(snippet.lower().split())
+    return hashlib.sha1(f"{url}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+def _fts_query(text: str) -> str:
+    """把自然语言查询转成 FTS5 的 OR 查询，每个词加引号避免语法字符报错"""
+    tokens = dict.fromkeys(t.lower() for t in _TOKEN_RE.findall(text))
+    return " OR ".join(f'"{t}"' for t in tokens)
+
+
+class ReviewCorpus:
+    """去重后的评测片段库
+
+    同一 (url, 片段) 只存一份，重复抓取只刷新 fetched_at
+    连接跨线程共享（调用方用 asyncio.to_thread），写入由锁串行化
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def add_results(self, results: list[SearchResult]) -> int:
+        """写入搜索结果中的片段，返回新增条数"""
+        now = time.time()
+        rows = [
+            (_snippet_hash(hit.url, hit.snippet), hit.url, hit.domain, hit.title, hit.snippet,
+             int(is_priority_source(hit.url)), now)
+            for r in results if not r.error
+            for hit in r.hits if hit.url and hit.snippet
+        ]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            before = self._conn.execute("SELECT COUNT(*) FROM snippets").fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO snippets (hash, url, domain, title, snippet, priority, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET fetched_at = excluded.fetched_at",
+                rows,
+            )
+            return self._conn.execute("SELECT COUNT(*) FROM snippets").fetchone()[0] - before
+
+    def search(self, query: str, limit: int = 8, max_age_days: float | None = None,
+               priority_only: bool = False) -> list[SearchHit]:
+        """BM25 排序的全文检索，标题权重高于正文，高优先级来源加权"""
+        match = _fts_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT s.title, s.url, s.domain, s.snippet, s.fetched_at, "
+            "bm25(snippets_fts, 2.0, 1.0) * (CASE WHEN s.priority THEN ? ELSE 1.0 END) AS rank "
+            "FROM snippets_fts JOIN snippets s ON s.id = snippets_fts.rowid "
+            "WHERE snippets_fts MATCH ?"
+        )
+        params: list = [PRIORITY_BOOST, match]
+        if max_age_days is not None:
+            sql += " AND s.fetched_at >= ?"
+            params.append(time.time() - max_age_days * 86400)
+        if priority_only:
+            sql += " AND s.priority = 1"
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            SearchHit(title=title, url=url, domain=domain, score=round(-rank, 2), snippet=snippet, fetched_at=fetched_at)
+            for title, url, domain, snippet, fetched_at, rank in rows
+        ]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM snippets").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+_corpus: ReviewCorpus | None = None
+
+
+def get_corpus() -> ReviewCorpus:
+    """进程内共享的语料库实例（首次使用时打开）"""
+    global _corpus
+    if _corpus is None:
+        _corpus = ReviewCorpus(CORPUS_PATH)
+        logger.info("Corpus | opened %s (%d snippets)", CORPUS_PATH, len(_corpus))
+    return _corpus
@@ -0,0 +1,147 @@
+"""RunAI 评测结果流 - JSONL 逐条写入 + 在线聚合 + 分位数草图
+[I N P U T]: run_eval.py 逐个产出的用例结果记录、已有的结果文件（.jsonl / .jsonl.gz / 旧版 .json）
+[O U T P U T]: ResultsWriter / read_results / QuantileSketch / EvalAggregator
+[P O S]: runai-v2/eval/ 的结果存储层，用例跑完即落盘，汇总只保留计数和草图，内存与用例数无关
+"""
+
+import gzip
+import json
+import math
+from pathlib import Path
+from typing import Iterator
+
+
+def _open(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class ResultsWriter:
+    """一行一条结果的 JSONL 写入器，路径以 .gz 结尾时 gzip 压缩
+
+    每条写完立即 flush，评测中途中断时已完成的用例不会丢
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = _open(self.path, "w")
+        self.count = 0
+
+    def write(self, record: dict):
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._f.flush()
+        self.count += 1
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_results(path: str | Path) -> Iterator[dict]:
+    """逐条读取结果文件；兼容旧版整体 JSON 数组（这种只能一次性读入）"""
+    path = Path(path)
+    if path.suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    with _open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class QuantileSketch:
+    """DDSketch 式的对数分桶分位数草图
+
+    正数 x 落在第 ceil(log_gamma(x)) 个桶，gamma = (1+a)/(1-a)，
+    任意分位数的相对误差不超过 a；桶数只与数值跨度的对数有关，与样本数无关
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.alpha = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, x: float):
+        self.count += 1
+        if x <= 0:
+            self.zeros += 1
+            return
+        k = math.ceil(math.log(x) / self._log_gamma)
+        self.buckets[k] = self.buckets.get(k, 0) + 1
+
+    def merge(self, other: "QuantileSketch"):
+        for k, n in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if rank < seen:
+                # 桶 (gamma^(k-1), gamma^k] 的中点估计
+                return 2 * self.gamma ** k / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class EvalAggregator:
+    """评测汇总的在线版本：计数、均值、总和，耗时和得分的分位数用草图"""
+
+    def __init__(self):
+        self.count = 0
+        self.success = 0
+        self.scored = 0
+        self.score_sum = 0.0
+        self.duration_sum = 0.0
+        self.cost_sum = 0.0
+        self.durations = QuantileSketch()
+        self.scores = QuantileSketch()
+        self.by_category: dict[str, list[int]] = {}  # category -> [用例数, 成功数]
+
+    def add(self, r: dict):
+        self.count += 1
+        self.success += bool(r.get("success"))
+        duration = r.get("duration_seconds") or 0.0
+        self.duration_sum += duration
+        self.durations.add(duration)
+        if r.get("eval_score"):
+            score = r["eval_score"]["total_score"]
+            self.scored += 1
+            self.score_sum += score
+            self.scores.add(score)
+        self.cost_sum += sum(p.get("cost_usd", 0) for p in (r.get("metrics") or {}).get("phases", {}).values())
+        cat = self.by_category.setdefault(r.get("category", ""), [0, 0])
+        cat[0] += 1
+        cat[1] += bool(r.get("success"))
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "success": self.success,
+            "avg_score": self.score_sum / self.scored if self.scored else 0,
+            "p50_score": self.scores.quantile(0.5),
+            "total_seconds": self.duration_sum,
+            "avg_seconds": self.duration_sum / self.count if self.count else 0,
+            "p50_seconds": self.durations.quantile(0.5),
+            "p90_seconds": self.durations.quantile(0.9),
+            "p99_seconds": self.durations.quantile(0.99),
+            "total_cost_usd": self.cost_sum,
+            "by_category": {k: {"count": v[0], "success": v[1]} for k, v in self.by_category.items()},
+        }
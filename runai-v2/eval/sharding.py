@@ -0,0 +1,68 @@
+"""RunAI 评测分片 - 按 case id 稳定哈希切分 + 确定性合并
+[I N P U T]: 测试用例列表（test_cases.json 的 cases）、各分片结果文件（JSONL，经 results_stream.read_results 读取）
+[O U T P U T]: parse_shard / shard_cases / shard_output_path / merge_shard_results
+[P O S]: runai-v2/eval/ 的分片层，被 run_eval.py 的 --shard / --shards 使用
+"""
+
+import hashlib
+import heapq
+from pathlib import Path
+from typing import Iterator
+
+from eval.results_stream import read_results
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """解析 "i/N" 格式的分片参数，i 从 0 开始"""
+    try:
+        index_s, count_s = spec.split("/", 1)
+        index, count = int(index_s), int(count_s)
+    except ValueError:
+        raise ValueError(f"Invalid shard spec {spec!r}, expected 'i/N' (e.g. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec {spec!r}, need 0 <= i < N")
+    return index, count
+
+
+def shard_of(case_id, count: int) -> int:
+    """稳定哈希：同一 case id 在任何机器、任何进程中都落在同一分片
+
+    不用内置 hash()，它对 str 有进程级随机化（PYTHONHASHSEED）
+    """
+    digest = hashlib.sha1(str(case_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def shard_cases(cases: list[dict], index: int, count: int) -> list[tuple[int, dict]]:
+    """返回属于本分片的 (原始序号, case) 列表，保持原始顺序"""
+    return [(i, case) for i, case in enumerate(cases) if shard_of(case["id"], count) == index]
+
+
+def shard_output_path(output_dir: str | Path, run_id: str, index: int, count: int, compress: bool = False) -> Path:
+    """分片结果文件路径（JSONL，compress 时 gzip），同一 run_id 下的分片文件由 merge 收集"""
+    suffix = ".jsonl.gz" if compress else ".jsonl"
+    return Path(output_dir) / f"eval_results_{run_id}.shard-{index}-of-{count}{suffix}"
+
+
+def merge_shard_results(cases: list[dict], shard_paths: list[str | Path]) -> Iterator[dict]:
+    """按 cases 原始顺序流式合并各分片结果，与串行运行结果一致
+
+    每个分片文件本身按原始顺序写入，用 heapq.merge 做 k 路归并，内存只占每个分片当前的一条；
+    缺失、重复或不属于 cases 的结果直接报错，避免静默产出不完整的汇总
+    """
+    order = {case["id"]: i for i, case in enumerate(cases)}
+    streams = [read_results(path) for path in shard_paths]
+    expected = 0
+    for r in heapq.merge(*streams, key=lambda r: order.get(r["case_id"], -1)):
+        idx = order.get(r["case_id"])
+        if idx is None:
+            raise ValueError(f"Case #{r['case_id']} is not in the test case file")
+        if idx < expected:
+            raise ValueError(f"Case #{r['case_id']} appears in more than one shard (or a shard is out of order)")
+        if idx > expected:
+            raise ValueError(f"Missing results for cases: {[c['id'] for c in cases[expected:idx]]}")
+        expected += 1
+        yield r
+
+    if expected < len(cases):
+        raise ValueError(f"Missing results for cases: {[c['id'] for c in cases[expected:]]}")
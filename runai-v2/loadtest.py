@@ -0,0 +1,304 @@
+"""RunAI 压测脚本 - 模拟 N 个并发用户调用 run_agent
+[I N P U T]: 依赖 agent.py 的 run_agent, standin_server.py 的 StandInServer, eval/ 下的用例文件
+[O U T P U T]: 每个负载档位的吞吐、延迟分位数、事件循环延迟、本进程与存活子进程的峰值 RSS、本档位的上游请求数，写入 JSON 作为容量曲线
+[P O S]: runai-v2/ 的容量规划工具，关闭 WebSearch 后工具层 HTTP 全部打到本地替身，只有模型调用走真实 API
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from standin_server import StandInServer
+
+EVAL_DIR = Path(__file__).parent.parent / "eval"
+DEFAULT_CASE_FILES = [
+    EVAL_DIR / "test_cases.json",
+    EVAL_DIR / "running_shoes_test_cases_full.json",
+]
+
+
+def load_workload(paths: list[Path]) -> list[dict]:
+    """读取用例文件中的 query / mock_answers / profile，按 query 去重"""
+    seen = set()
+    workload = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for case in json.load(f).get("cases", []):
+                if case["query"] in seen:
+                    continue
+                seen.add(case["query"])
+                workload.append({
+                    "query": case["query"],
+                    "mock_answers": case.get("mock_answers"),
+                    "profile": case.get("profile"),
+                })
+    return workload
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """最近秩分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def peak_rss_mb() -> dict:
+    """本进程的峰值 RSS，以及已退出子进程中最大的那一个的峰值 RSS，单位 MB
+
+    RUSAGE_CHILDREN 只统计已回收的单个子进程，不能代表同时存活的多个 CLI 的总内存，
+    后者由 ChildRSSSampler 采样；ru_maxrss 在 Linux 上是 KB，在 macOS 上是 bytes
+    """
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "largest_exited_child": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def live_children_rss_mb(root: int | None = None) -> float | None:
+    """root（默认本进程）所有存活后代进程的 RSS 之和，单位 MB；没有 /proc 的平台返回 None"""
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return None
+    root = root or os.getpid()
+    children: dict[int, list[int]] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            # comm 可能含空格和括号，ppid 取最后一个 ")" 之后的第 2 个字段
+            stat = (entry / "stat").read_text()
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    page = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    stack = list(children.get(root, []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            total += int((proc / str(pid) / "statm").read_text().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / (1024 * 1024)
+
+
+class ChildRSSSampler:
+    """周期性采样存活子进程（SDK 拉起的 CLI）的 RSS 总和，记录本档位的峰值"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.peak: float | None = None
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            # 遍历 /proc 放到线程里，不计入事件循环延迟
+            rss = await asyncio.to_thread(live_children_rss_mb)
+            if rss is not None:
+                self.peak = max(self.peak or 0.0, rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class LoopLagMonitor:
+    """周期性 sleep，测量实际唤醒时间比预期晚多少，反映事件循环被阻塞的程度"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+async def run_level(run_agent, workload: list[dict], *, concurrency: int | None, rate: float | None,
+                    duration: float) -> dict:
+    """跑一个负载档位
+
+    concurrency: 闭环模式，N 个用户各自循环发请求
+    rate: 开环模式，按泊松到达（每秒 rate 个）发请求，不等待前一个完成
+    """
+    latencies: list[float] = []
+    errors: list[str] = []
+    cases = itertools.cycle(workload)
+    monitor = LoopLagMonitor()
+    monitor.start()
+    child_rss = ChildRSSSampler()
+    child_rss.start()
+
+    async def one_request():
+        case = next(cases)
+        start = time.perf_counter()
+        try:
+            await run_agent(case["query"], mock_answers=case["mock_answers"], profile=case["profile"])
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(str(e)[:200])
+
+    started = time.perf_counter()
+    deadline = started + duration
+
+    if concurrency:
+        async def user():
+            while time.perf_counter() < deadline:
+                await one_request()
+        await asyncio.gather(*[user() for _ in range(concurrency)])
+    else:
+        in_flight: set[asyncio.Task] = set()
+        while time.perf_counter() < deadline:
+            task = asyncio.create_task(one_request())
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            await asyncio.sleep(random.expovariate(rate))
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    await child_rss.stop()
+    rss = {k: round(v, 1) for k, v in peak_rss_mb().items()}
+    rss["live_children"] = round(child_rss.peak, 1) if child_rss.peak is not None else None
+
+    return {
+        "concurrency": concurrency,
+        "rate": rate,
+        "elapsed_seconds": round(elapsed, 2),
+        "completed": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "throughput_rps": round(len(latencies) / elapsed, 4) if elapsed else 0,
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p90": round(percentile(latencies, 90), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0), 3),
+        },
+        "loop_lag_ms": {
+            "p50": round(percentile(monitor.samples, 50) * 1000, 2),
+            "p99": round(percentile(monitor.samples, 99) * 1000, 2),
+            "max": round(max(monitor.samples, default=0) * 1000, 2),
+        },
+        "peak_rss_mb": rss,
+    }
+
+
+def print_level(r: dict):
+    label = f"c={r['concurrency']}" if r["concurrency"] else f"rate={r['rate']}/s"
+    lat, lag, rss = r["latency_seconds"], r["loop_lag_ms"], r["peak_rss_mb"]
+    print(
+        f"{label:<12} {r['completed']:>5} {r['errors']:>4} {r['throughput_rps']:>8.3f} "
+        f"{lat['p50']:>7.1f} {lat['p90']:>7.1f} {lat['p99']:>7.1f} "
+        f"{lag['p99']:>8.1f} {rss['self']:>8.1f} "
+        f"{rss['live_children'] if rss['live_children'] is not None else 'n/a':>9}"
+    )
+
+
+async def main(args: argparse.Namespace):
+    workload = load_workload([Path(p) for p in args.cases] if args.cases else DEFAULT_CASE_FILES)
+
+    with StandInServer(latency=args.upstream_latency) as server, tempfile.TemporaryDirectory() as tmp:
+        # 工具层读取这些环境变量，必须在 import agent 之前设置
+        os.environ["TAVILY_API_URL"] = server.tavily_url
+        os.environ["SERPAPI_URL"] = server.serpapi_url
+        # 替身返回的是假片段，语料库写到临时文件，不污染 data/review_corpus.db
+        os.environ["CORPUS_PATH"] = str(Path(tmp) / "review_corpus.db")
+        # 服务端 WebSearch 不经过替身，关掉后搜索都走 tavily_search；LangSmith 导出默认关闭，不干扰测量
+        os.environ["WEBSEARCH_ENABLED"] = "0"
+        os.environ["LANGSMITH_TRACE_MODE"] = args.trace_mode
+        # 默认不限时，压测按线上服务的设定开启，超时的请求用预留时间补写推荐
+        os.environ["REQUEST_DEADLINE_SECONDS"] = str(args.deadline) if args.deadline else "none"
+        os.environ.setdefault("TAVILY_API_KEY", "stand-in")
+        os.environ.setdefault("SERPAPI_KEY", "stand-in")
+        from agent import run_agent
+        from tools import SEARCH_ROUTER
+
+        if args.rate:
+            levels = [{"concurrency": None, "rate": float(x)} for x in args.rate.split(",")]
+        else:
+            levels = [{"concurrency": int(x), "rate": None} for x in args.concurrency.split(",")]
+
+        print(f"\n{'#'*60}")
+        print(f"# RunAI 压测 - {len(workload)} 条查询, 每档 {args.duration:.0f}s")
+        print(f"# 上游替身: {server.base_url} (latency {args.upstream_latency}s)")
+        print(f"{'#'*60}\n")
+        print(f"{'Level':<12} {'Done':>5} {'Err':>4} {'RPS':>8} {'p50(s)':>7} {'p90(s)':>7} {'p99(s)':>7} "
+              f"{'Lag99ms':>8} {'RSS(MB)':>8} {'Kids(MB)':>9}")
+        print("─" * 89)
+
+        curve = []
+        for level in levels:
+            before = server.request_count
+            r = await run_level(run_agent, workload, duration=args.duration, **level)
+            r["upstream_requests"] = server.request_count - before
+            curve.append(r)
+            print_level(r)
+
+    output_path = Path(args.output_dir) / f"loadtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"upstream_latency": args.upstream_latency, "duration": args.duration, "trace_mode": args.trace_mode,
+                   "deadline": args.deadline,
+                   "levels": curve, "search_backends": SEARCH_ROUTER.stats()},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n容量曲线已保存: {output_path}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="RunAI run_agent 压测")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--concurrency", default="1,2,4,8", help="闭环并发档位，逗号分隔")
+    group.add_argument("--rate", help="开环到达率档位（请求/秒），逗号分隔")
+    parser.add_argument("--duration", type=float, default=120.0, help="每档持续时间（秒）")
+    parser.add_argument("--upstream-latency", type=float, default=0.3, help="替身模拟的上游耗时（秒）")
+    parser.add_argument("--cases", nargs="+", help="用例文件（默认 eval/ 下两个文件）")
+    parser.add_argument("--deadline", type=float, default=180.0, help="单次请求时限（秒），0 表示不限")
+    parser.add_argument("--trace-mode", choices=["off", "all", "tail"], default="off",
+                        help="LangSmith 追踪模式（默认关闭，避免导出开销计入测量）")
+    parser.add_argument("--output-dir", default=str(EVAL_DIR / "results"), help="结果目录")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,143 @@
+"""RunAI 日志管线 - 队列异步输出 + 按事件采样 + JSON 格式
+[I N P U T]: 无外部依赖（只用标准库 logging），由 config.py 的 setup_logging 调用
+[O U T P U T]: 对外提供 install_pipeline(), stop_pipeline(), EventSampler, JsonFormatter, NonBlockingQueueHandler
+[P O S]: runai-v2/ 的日志基础设施，调用方只做 put_nowait，格式化和写 stderr 都在后台线程
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+
+# LogRecord 自带的属性，其余属性视为 extra 字段输出到 JSON
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def event_name(record: logging.LogRecord) -> str:
+    """事件名取消息模板里 " | " 前的部分，如 "ToolCall | %s → %.100s" → "ToolCall"
+
+    只看模板（record.msg）不看参数，不触发格式化
+    """
+    msg = record.msg if isinstance(record.msg, str) else ""
+    head, sep, _ = msg.partition(" | ")
+    return head if sep else ""
+
+
+class EventSampler(logging.Filter):
+    """按事件名采样：rates 里的事件只保留给定比例，其余事件全部保留
+
+    用累加器均匀抽取（rate=0.1 即每 10 条留 1 条），比随机数更稳定；
+    保留下来的记录带上 sample_rate，下游统计可据此还原总量
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._acc: dict[str, float] = {}
+        self.dropped: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = event_name(record)
+        rate = self.rates.get(event)
+        if rate is None or rate >= 1.0:
+            return True
+        acc = self._acc.get(event, 1.0) + rate
+        if acc >= 1.0:
+            self._acc[event] = acc - 1.0
+            record.sample_rate = rate
+            return True
+        self._acc[event] = acc
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """只入队不格式化的 QueueHandler
+
+    标准 QueueHandler.prepare() 会在调用线程里拼接消息；这里原样入队，
+    %-参数在后台线程由 QueueListener 的 handler 格式化。队列满时丢弃并计数，不阻塞事件循环
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一个 JSON 对象：ts / level / logger / event / msg，以及 extra 字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": event_name(record),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: NonBlockingQueueHandler | None = None
+_lock = threading.Lock()
+
+
+def install_pipeline(
+    level: int,
+    fmt: str = "text",
+    text_format: str = "[%(levelname)s] %(message)s",
+    sample_rates: dict[str, float] | None = None,
+    queue_size: int = 10000,
+) -> logging.handlers.QueueListener:
+    """给 root logger 装上 队列 handler → 后台线程 → stderr 的管线（进程内只装一次）"""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        output = logging.StreamHandler()
+        output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(text_format))
+
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        if sample_rates:
+            handler.addFilter(EventSampler(sample_rates))
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(handler)
+        _handler = handler
+
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        # 退出前把队列里剩余的日志写完
+        atexit.register(stop_pipeline)
+        return _listener
+
+
+def stop_pipeline():
+    """停止后台线程并刷完队列"""
+    global _listener, _handler
+    with _lock:
+        if _handler is not None:
+            logging.getLogger().removeHandler(_handler)
+            _handler = None
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,93 @@
+"""RunAI 价格预取 - 从助手文本识别鞋款，提前查价格和购买链接
+[I N P U T]: 依赖 tools.py 的 prefetch_shopping, session.py 的 ToolSession
+[O U T P U T]: 对外提供 extract_shoe_models(), PricePrefetcher
+[P O S]: runai-v2/ 的投机执行层，run_agent 消费 AssistantMessage 文本时调用，把比价移出关键路径
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import asyncio
+import re
+
+from config import SHOPPING_PREFETCH_MAX, logger
+from session import ToolSession
+from tools import prefetch_shopping
+
+# 品牌名大小写不敏感；"On" 必须大小写精确匹配，避免误伤英文介词
+_BRANDS = (
+    r"(?i:hoka(?:\s+one\s+one)?|asics|nike|adidas|new\s+balance|nb|saucony|brooks"
+    r"|mizuno|puma|altra|li-?ning|anta|xtep|361°?)|On"
+)
+
+# 品牌 + 1~4 个首字母大写的型号词 + 代数（如 "Bondi 8"、"Gel-Nimbus 26"、"Rebel v4"），
+# 或 NB 式的数字型号（如 "1080v13"、"Fresh Foam X 880v14"）；
+# 边界只看 ASCII：\w 会匹配中文，"Gel-Kayano 31是稳定鞋" 这种紧跟中文的写法会被漏掉
+_MODEL_WORD = r"[A-Z][A-Za-z0-9+\-]*"
+SHOE_MODEL_PATTERN = re.compile(
+    r"(?<![A-Za-z0-9-])(?:" + _BRANDS + r")\s+(?:"
+    r"(?:" + _MODEL_WORD + r"\s+){0,3}?\d{3,4}v\d{1,2}"
+    r"|(?:" + _MODEL_WORD + r"\s+){0,3}?" + _MODEL_WORD + r"\s*v?\d{1,2}(?:\.\d)?"
+    r")(?![A-Za-z0-9]|\.\d)"
+)
+
+
+def extract_shoe_models(text: str) -> list[str]:
+    """提取文本中出现的具体鞋款名，按首次出现顺序去重（忽略大小写和空白差异）
+
+    >>> extract_shoe_models("ASICS Gel-Kayano 31是稳定鞋，Saucony Endorphin Speed 4比较轻")
+    ['ASICS Gel-Kayano 31', 'Saucony Endorphin Speed 4']
+    >>> extract_shoe_models("宽脚可以看 New Balance 1080v13 或 NB Fresh Foam X 880v14。")
+    ['New Balance 1080v13', 'NB Fresh Foam X 880v14']
+    >>> extract_shoe_models("Nike 2 双以上打折，Nike Pegasus 41 和 adidas Adizero Adios Pro 3 都行")
+    ['Nike Pegasus 41', 'adidas Adizero Adios Pro 3']
+    """
+    seen = set()
+    models = []
+    for m in SHOE_MODEL_PATTERN.finditer(text):
+        name = " ".join(m.group(0).split())
+        key = name.lower()
+        if key not in seen:
+            seen.add(key)
+            models.append(name)
+    return models
+
+
+class PricePrefetcher:
+    """投机预取：模型在文本里提到鞋款时就在后台开始查价
+
+    结果写入同一个 ToolSession，模型随后调用 google_shopping 时
+    直接拿到已完成（或正在进行）的请求，不再串行等待两轮 SerpAPI
+    """
+
+    def __init__(self, session: ToolSession, max_models: int = SHOPPING_PREFETCH_MAX):
+        self.session = session
+        self.max_models = max_models
+        self.started: list[str] = []
+        self._seen: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    def observe(self, text: str):
+        """扫描一段助手文本，对新出现的鞋款启动后台查价"""
+        remaining = self.max_models - len(self.started)
+        if remaining <= 0:
+            return
+
+        new_models = []
+        for name in extract_shoe_models(text):
+            key = name.lower()
+            if key not in self._seen:
+                self._seen.add(key)
+                new_models.append(name)
+        new_models = new_models[:remaining]
+        if not new_models:
+            return
+
+        self.started.extend(new_models)
+        logger.info("Prefetch | google_shopping %s", new_models)
+        task = asyncio.create_task(prefetch_shopping(self.session, new_models))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
@@ -0,0 +1,208 @@
+"""RunAI 工具结果结构 - 类型化记录 + 文本渲染
+[I N P U T]: Tavily / SerpAPI 的原始 JSON（由 tools.py 传入）
+[O U T P U T]: 对外提供 SearchHit, SearchResult, StoreLink, Product, ShoppingResult, render_search(), render_shopping()
+[P O S]: runai-v2/ 的结果表示层，工具只产出记录，最后一步才按 TOOL_OUTPUT_FORMAT 渲染成文本
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+SNIPPET_MAX_CHARS = 300
+
+
+def _domain(url: str) -> str:
+    netloc = urlparse(url).netloc
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def _squash(text: str, limit: int = SNIPPET_MAX_CHARS) -> str:
+    """合并空白并截断，评测摘要里的换行和缩进对模型没有信息量"""
+    return " ".join(text.split())[:limit]
+
+
+# ============================================================
+# 搜索结果 - Search
+# ============================================================
+
+@dataclass
+class SearchHit:
+    """单条搜索结果"""
+    title: str
+    url: str
+    domain: str
+    score: float
+    snippet: str
+    fetched_at: float = 0.0  # 本地语料库的抓取时间，0 表示实时结果
+
+    @classmethod
+    def from_tavily(cls, r: dict) -> "SearchHit":
+        url = r.get("url", "")
+        return cls(
+            title=r.get("title", "N/A"),
+            url=url,
+            domain=_domain(url),
+            score=r.get("score", 0) or 0,
+            snippet=r.get("content", "") or "",
+            fetched_at=r.get("fetched_at", 0.0) or 0.0,
+        )
+
+
+@dataclass
+class SearchResult:
+    """一个查询的搜索结果"""
+    query: str
+    answer: str = ""
+    hits: list[SearchHit] = field(default_factory=list)
+    error: str = ""
+    backend: str = ""  # 结果来自哪个搜索后端（search_backends.py）
+
+    @classmethod
+    def from_tavily(cls, query: str, data: dict) -> "SearchResult":
+        return cls(
+            query=query,
+            answer=data.get("answer") or "",
+            hits=[SearchHit.from_tavily(r) for r in data.get("results", [])],
+            backend=data.get("backend", ""),
+        )
+
+
+def _search_verbose(r: SearchResult) -> str:
+    output = f'## Search Results for "{r.query}"\n\n'
+    if r.error:
+        return output + f"Error: {r.error}\n\n"
+    if r.answer:
+        output += f"### Answer\n\n{r.answer}\n\n"
+    for i, hit in enumerate(r.hits, 1):
+        output += f"**{i}. {hit.title}**\n"
+        output += f"URL: {hit.url or 'N/A'}\n"
+        output += f"Score: {hit.score:.2f}\n"
+        if hit.fetched_at:
+            output += f"Fetched: {time.strftime('%Y-%m-%d', time.localtime(hit.fetched_at))}\n"
+        output += f"{hit.snippet[:SNIPPET_MAX_CHARS]}\n\n---\n\n"
+    return output
+
+
+def _search_compact(r: SearchResult) -> str:
+    lines = [f"Q: {r.query}"]
+    if r.error:
+        lines.append(f"Error: {r.error}")
+        return "\n".join(lines)
+    if r.answer:
+        lines.append(f"A: {_squash(r.answer, 600)}")
+    for i, hit in enumerate(r.hits, 1):
+        head = f"[{i}] {hit.title} | {hit.url}"
+        if hit.fetched_at:
+            head += f" | fetched {time.strftime('%Y-%m-%d', time.localtime(hit.fetched_at))}"
+        lines.append(head)
+        if hit.snippet:
+            lines.append(_squash(hit.snippet))
+    return "\n".join(lines)
+
+
+def render_search(results: list[SearchResult], fmt: str = "compact") -> str:
+    """compact：省掉 Score / 分隔线 / markdown 装饰；verbose：原有的 markdown 格式，便于调试"""
+    if fmt == "verbose":
+        return "".join(_search_verbose(r) for r in results)
+    return "\n\n".join(_search_compact(r) for r in results)
+
+
+# ============================================================
+# 购物结果 - Shopping
+# ============================================================
+
+@dataclass
+class StoreLink:
+    """卖家直链"""
+    name: str
+    price: str
+    link: str
+
+
+@dataclass
+class Product:
+    """一个商品及其卖家"""
+    title: str
+    price: str
+    source: str
+    link: str
+    rating: float | None = None
+    reviews: int = 0
+    thumbnail: str = ""
+    stores: list[StoreLink] = field(default_factory=list)
+
+    @classmethod
+    def from_serpapi(cls, p: dict) -> "Product":
+        return cls(
+            title=p.get("title", "N/A"),
+            price=str(p.get("price") or p.get("extracted_price") or "N/A"),
+            source=p.get("source", "N/A"),
+            link=p.get("product_link") or "N/A",
+            rating=p.get("rating"),
+            reviews=p.get("reviews", 0),
+            thumbnail=p.get("thumbnail", ""),
+        )
+
+
+@dataclass
+class ShoppingResult:
+    """一个查询的购物结果；rate_limited 单独标记，提示模型改用 Tavily 查价"""
+    query: str
+    products: list[Product] = field(default_factory=list)
+    error: str = ""
+    rate_limited: bool = False
+
+
+def _shopping_verbose(r: ShoppingResult) -> str:
+    out = f'## Google Shopping Results for "{r.query}"\n\n'
+    if r.rate_limited:
+        return out + "⚠️ **API Rate Limited** - Price lookup failed. Use Tavily to search for prices instead.\n\n"
+    if r.error:
+        return out + f"Error: {r.error}\n\n"
+    if not r.products:
+        return out + f'No products found for "{r.query}"\n'
+
+    for i, p in enumerate(r.products, 1):
+        out += f"### {i}. {p.title}\n"
+        if p.thumbnail:
+            out += f"![{p.title}]({p.thumbnail})\n"
+        out += f"**Price**: {p.price}\n"
+        out += f"**Source**: {p.source}\n"
+        if p.rating:
+            out += f"**Rating**: {p.rating} ({p.reviews} reviews)\n"
+        if p.stores:
+            out += "**Purchase Links**:\n"
+            for store in p.stores:
+                out += f"  - [{store.name}]({store.link}) - {store.price}\n"
+        else:
+            out += f"**Link**: {p.link}\n"
+        out += "\n---\n\n"
+    return out
+
+
+def _shopping_compact(r: ShoppingResult) -> str:
+    lines = [f"Q: {r.query}"]
+    if r.rate_limited:
+        lines.append("Rate limited - use tavily_search for prices")
+    elif r.error:
+        lines.append(f"Error: {r.error}")
+    elif not r.products:
+        lines.append("No products found")
+    for p in r.products:
+        head = f"- {p.title} | {p.price} | {p.source}"
+        if p.rating:
+            head += f" | {p.rating}★({p.reviews})"
+        lines.append(head)
+        if p.stores:
+            lines.append("  " + "; ".join(f"{s.name} {s.price} {s.link}" for s in p.stores))
+        else:
+            lines.append(f"  {p.link}")
+    return "\n".join(lines)
+
+
+def render_shopping(results: list[ShoppingResult], fmt: str = "compact") -> str:
+    """compact：去掉缩略图和 markdown 装饰，一行商品一行链接；verbose：原有格式"""
+    if fmt == "verbose":
+        return "".join(_shopping_verbose(r) for r in results)
+    return "\n\n".join(_shopping_compact(r) for r in results)
@@ -1,9 +1,12 @@
 """RunAI Agent 评测脚本 - 运行测试用例并记录到 LangSmith"""
 
+import argparse
 import asyncio
 import json
+import multiprocessing
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -13,140 +16,362 @@ from dotenv import load_dotenv
 sys.path.insert(0, str(Path(__file__).parent))
 
 from agent import run_agent
+from config import LANGSMITH_TRACE_MODE
+from eval.results_stream import EvalAggregator, ResultsWriter, read_results
 from eval.scorer import RunAIScorer
+from eval.sharding import merge_shard_results, parse_shard, shard_cases, shard_output_path
 
 # Load environment variables
 load_dotenv()
 
 
-async def run_eval(test_cases_path: str, output_dir: str = None):
-    """Run evaluation on test cases"""
-
-    # Load test cases
+def load_cases(test_cases_path: str) -> list[dict]:
+    """读取测试用例文件"""
     with open(test_cases_path, "r", encoding="utf-8") as f:
         data = json.load(f)
-
-    cases = data.get("cases", [])
+    return data.get("cases", [])
+
+
+async def run_case(case: dict, scorer: RunAIScorer, tiered: bool | None = None) -> dict:
+    """运行并评分单个用例，返回结果记录（含各阶段耗时 / 成本）"""
+    start_time = datetime.now()
+    metrics: dict = {}
+    record = {
+        "case_id": case["id"],
+        "category": case["category"],
+        "query": case["query"],
+        "expected": case["soft_reference"]["suggested_shoes"],
+    }
+
+    try:
+        # 传入 mock_answers 和 profile 用于自动回答追问
+        result = await run_agent(
+            user_query=case["query"],
+            mock_answers=case.get("mock_answers"),
+            profile=case.get("profile"),
+            tiered=tiered,
+            metrics=metrics,
+            trace_key=str(case["id"]),
+        )
+        duration = (datetime.now() - start_time).total_seconds()
+
+        # 自动评分
+        eval_result = scorer.score(result, case)
+
+        record.update({
+            "result": result,
+            "duration_seconds": duration,
+            "success": True,
+            "error": None,
+            "eval_score": eval_result.to_dict(),
+            "metrics": metrics,
+        })
+
+    except Exception as e:
+        record.update({
+            "result": None,
+            "duration_seconds": (datetime.now() - start_time).total_seconds(),
+            "success": False,
+            "error": str(e),
+            "metrics": metrics,
+        })
+
+    return record
+
+
+async def run_eval(
+    test_cases_path: str,
+    output_dir: str = None,
+    shard: tuple[int, int] | None = None,
+    output_path: str | None = None,
+    tiered: bool | None = None,
+    compress: bool = False,
+) -> dict:
+    """Run evaluation on test cases
+
+    结果逐条写入 JSONL（每个用例跑完立即落盘），汇总用在线聚合，内存不随用例数增长
+
+    Args:
+        test_cases_path: 测试用例文件
+        output_dir: 结果目录（自动生成文件名）
+        shard: (i, N)，只运行按 case id 哈希落在第 i 片的用例
+        output_path: 指定结果文件路径（分片运行时使用），优先于 output_dir
+        tiered: 是否分层执行，None 时取 config.TIERED_MODE
+        compress: 自动生成文件名时使用 .jsonl.gz
+    """
+    cases = load_cases(test_cases_path)
+    if shard:
+        selected = [case for _, case in shard_cases(cases, *shard)]
+    else:
+        selected = cases
     scorer = RunAIScorer()
 
+    if not output_path and output_dir:
+        suffix = ".jsonl.gz" if compress else ".jsonl"
+        output_path = Path(output_dir) / f"eval_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}"
+
+    shard_label = f" [shard {shard[0]}/{shard[1]}]" if shard else ""
     print(f"\n{'#'*60}")
-    print(f"# RunAI Agent 评测 - {len(cases)} 个测试用例")
+    print(f"# RunAI Agent 评测{shard_label} - {len(selected)} 个测试用例")
     print(f"# LangSmith Project: runai-eval")
     print(f"{'#'*60}\n")
 
-    results = []
-
-    for i, case in enumerate(cases, 1):
-        print(f"\n{'='*60}")
-        print(f"[{i}/{len(cases)}] Case #{case['id']}: {case['category']}")
-        print(f"{'='*60}")
-        print(f"Query: {case['query']}")
-        print(f"Expected: {case['soft_reference']['suggested_shoes']}")
-        print(f"-"*60)
-
-        start_time = datetime.now()
-
-        try:
-            # 传入 mock_answers 和 profile 用于自动回答追问
-            mock_answers = case.get("mock_answers")
-            profile = case.get("profile")
-
-            result = await run_agent(
-                user_query=case["query"],
-                mock_answers=mock_answers,
-                profile=profile,
-            )
-
-            duration = (datetime.now() - start_time).total_seconds()
-
-            # 自动评分
-            eval_result = scorer.score(result, case)
-
-            results.append({
-                "case_id": case["id"],
-                "category": case["category"],
-                "query": case["query"],
-                "expected": case["soft_reference"]["suggested_shoes"],
-                "result": result,
-                "duration_seconds": duration,
-                "success": True,
-                "error": None,
-                "eval_score": eval_result.to_dict(),
-            })
-
-            print(f"\n[Complete] Duration: {duration:.1f}s | Score: {eval_result.total_score}")
-            print(f"Result preview: {result[:200]}..." if result else "[No result]")
-
-        except Exception as e:
-            duration = (datetime.now() - start_time).total_seconds()
-
-            results.append({
-                "case_id": case["id"],
-                "category": case["category"],
-                "query": case["query"],
-                "expected": case["soft_reference"]["suggested_shoes"],
-                "result": None,
-                "duration_seconds": duration,
-                "success": False,
-                "error": str(e),
-            })
-
-            print(f"\n[Error] {e}")
-
-        # Wait between cases to avoid rate limiting
-        if i < len(cases):
-            print(f"\n[Waiting 5s before next case...]")
-            await asyncio.sleep(5)
+    aggregator = EvalAggregator()
+    writer = ResultsWriter(output_path) if output_path else None
+
+    try:
+        for i, case in enumerate(selected, 1):
+            print(f"\n{'='*60}")
+            print(f"[{i}/{len(selected)}]{shard_label} Case #{case['id']}: {case['category']}")
+            print(f"{'='*60}")
+            print(f"Query: {case['query']}")
+            print(f"Expected: {case['soft_reference']['suggested_shoes']}")
+            print(f"-"*60)
+
+            r = await run_case(case, scorer, tiered)
+            aggregator.add(r)
+            if writer:
+                writer.write(r)
+
+            if r["success"]:
+                print(f"\n[Complete] Duration: {r['duration_seconds']:.1f}s | Score: {r['eval_score']['total_score']}")
+                print(f"Result preview: {r['result'][:200]}..." if r["result"] else "[No result]")
+            else:
+                print(f"\n[Error] {r['error']}")
+
+            # Wait between cases to avoid rate limiting
+            if i < len(selected):
+                print(f"\n[Waiting 5s before next case...]")
+                await asyncio.sleep(5)
+    finally:
+        if writer:
+            writer.close()
+
+    summary = aggregator.summary()
+    print_summary(summary, output_path)
+    if output_path:
+        print(f"\n结果已保存: {output_path}")
 
-    # Summary
+    print(f"\n🔗 查看 LangSmith Traces: https://smith.langchain.com/")
+
+    return summary
+
+
+def print_summary(summary: dict, results_path: str | Path | None = None):
+    """打印评测汇总表；给了结果文件时逐行读取打印每个用例"""
     print(f"\n\n{'#'*60}")
     print(f"# 评测结果汇总")
     print(f"{'#'*60}")
 
-    success_count = sum(1 for r in results if r["success"])
-    total_duration = sum(r["duration_seconds"] for r in results)
+    if not summary["count"]:
+        print("\n无结果")
+        return
 
-    # 计算平均分
-    scores = [r["eval_score"]["total_score"] for r in results if r.get("eval_score")]
-    avg_score = sum(scores) / len(scores) if scores else 0
+    print(f"\n成功率: {summary['success']}/{summary['count']}")
+    print(f"平均分: {summary['avg_score']:.1f}")
+    print(f"总耗时: {summary['total_seconds']:.1f}s")
+    print(f"平均耗时: {summary['avg_seconds']:.1f}s")
+    print(f"耗时分位: p50 {summary['p50_seconds']:.1f}s | p90 {summary['p90_seconds']:.1f}s | p99 {summary['p99_seconds']:.1f}s")
 
-    print(f"\n成功率: {success_count}/{len(results)}")
-    print(f"平均分: {avg_score:.1f}")
-    print(f"总耗时: {total_duration:.1f}s")
-    print(f"平均耗时: {total_duration/len(results):.1f}s")
+    if not results_path:
+        return
 
     print(f"\n{'─'*60}")
     print(f"{'Case':<8} {'Category':<15} {'Score':<8} {'Time':<8} {'Status'}")
     print(f"{'─'*60}")
 
-    for r in results:
+    for r in read_results(results_path):
         status = "✅" if r["success"] else "❌"
-        score = r.get("eval_score", {}).get("total_score", 0)
+        score = (r.get("eval_score") or {}).get("total_score", 0)
         print(f"#{r['case_id']:<7} {r['category']:<15} {score:<8.1f} {r['duration_seconds']:<8.1f}s {status}")
 
-    # Save results
-    if output_dir:
-        output_path = Path(output_dir) / f"eval_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        print(f"\n结果已保存: {output_path}")
 
-    print(f"\n🔗 查看 LangSmith Traces: https://smith.langchain.com/")
+# ============================================================
+# 分层 vs 单模型对比 - Tiered Comparison
+# ============================================================
 
-    return results
+def _cost(r: dict) -> float:
+    return sum(p.get("cost_usd", 0) for p in r.get("metrics", {}).get("phases", {}).values())
 
 
-if __name__ == "__main__":
-    # Default paths
-    test_cases_path = Path(__file__).parent.parent / "eval" / "test_cases.json"
-    output_dir = Path(__file__).parent.parent / "eval" / "results"
+def _mode_stats(results: list[dict]) -> dict:
+    scores = [r["eval_score"]["total_score"] for r in results if r.get("eval_score")]
+    durations = sorted(r["duration_seconds"] for r in results)
+    return {
+        "success": sum(1 for r in results if r["success"]),
+        "avg_score": sum(scores) / len(scores) if scores else 0,
+        "avg_seconds": sum(durations) / len(durations) if durations else 0,
+        "p50_seconds": durations[len(durations) // 2] if durations else 0,
+        "total_cost_usd": sum(_cost(r) for r in results),
+    }
+
+
+def print_comparison(single: list[dict], tiered: list[dict]):
+    """单模型与分层模式逐用例对比，附各阶段耗时"""
+    print(f"\n\n{'#'*60}")
+    print(f"# 单模型 vs 分层 对比")
+    print(f"{'#'*60}")
 
-    print(f"Test cases: {test_cases_path}")
-    print(f"Output dir: {output_dir}")
+    print(f"\n{'Mode':<10} {'Success':<9} {'AvgScore':<10} {'AvgTime':<10} {'P50Time':<10} {'Cost($)'}")
+    for name, results in (("single", single), ("tiered", tiered)):
+        st = _mode_stats(results)
+        success = f"{st['success']}/{len(results)}"
+        avg_time = f"{st['avg_seconds']:.1f}s"
+        p50_time = f"{st['p50_seconds']:.1f}s"
+        print(f"{name:<10} {success:<9} {st['avg_score']:<10.1f} {avg_time:<10} {p50_time:<10} {st['total_cost_usd']:.4f}")
+
+    print(f"\n{'─'*72}")
+    print(f"{'Case':<8} {'Single':<18} {'Tiered':<18} {'Plan':<10} {'Synthesis'}")
+    print(f"{'─'*72}")
+    for s_r, t_r in zip(single, tiered):
+        s_score = s_r.get("eval_score", {}).get("total_score", 0)
+        t_score = t_r.get("eval_score", {}).get("total_score", 0)
+        phases = t_r.get("metrics", {}).get("phases", {})
+        plan_s = phases.get("plan", {}).get("duration_seconds", 0)
+        synth_s = phases.get("synthesis", {}).get("duration_seconds", 0)
+        print(f"#{s_r['case_id']:<7} {s_score:>5.1f} / {s_r['duration_seconds']:>6.1f}s    "
+              f"{t_score:>5.1f} / {t_r['duration_seconds']:>6.1f}s    {plan_s:>6.1f}s   {synth_s:>6.1f}s")
+
+
+async def run_compare(test_cases_path: str, output_path: str, shard: tuple[int, int] | None = None) -> dict:
+    """每个用例依次以单模型和分层模式运行，对比质量与延迟"""
+    cases = load_cases(test_cases_path)
+    selected = [case for _, case in shard_cases(cases, *shard)] if shard else cases
+    scorer = RunAIScorer()
+    single, tiered = [], []
+
+    for i, case in enumerate(selected, 1):
+        print(f"\n[{i}/{len(selected)}] Case #{case['id']}: {case['category']}")
+        for mode, bucket in ((False, single), (True, tiered)):
+            r = await run_case(case, scorer, tiered=mode)
+            bucket.append(r)
+            label = "tiered" if mode else "single"
+            score = r.get("eval_score", {}).get("total_score", 0)
+            print(f"  {label:<7} {r['duration_seconds']:>6.1f}s | Score: {score}" + ("" if r["success"] else f" | Error: {r['error']}"))
+            await asyncio.sleep(5)
+
+    print_comparison(single, tiered)
+    comparison = {"single": single, "tiered": tiered}
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(comparison, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output_path}")
+    return comparison
+
+
+# ============================================================
+# 分片运行 - Sharded Execution
+# ============================================================
+
+# 每个分片可用独立的 API key：设置 TAVILY_API_KEY_SHARD_0 等即覆盖对应分片
+SHARD_ENV_KEYS = ["TAVILY_API_KEY", "SERPAPI_KEY", "ANTHROPIC_API_KEY", "MINIMAX_API_KEY"]
+
+
+def _run_shard(test_cases_path: str, output_path: str, index: int, count: int, tiered: bool | None = None) -> str:
+    """子进程入口：独立事件循环跑一个分片，返回分片结果文件路径"""
+    for key in SHARD_ENV_KEYS:
+        override = os.environ.get(f"{key}_SHARD_{index}")
+        if override:
+            os.environ[key] = override
+    asyncio.run(run_eval(test_cases_path, shard=(index, count), output_path=output_path, tiered=tiered))
+    return output_path
+
+
+def run_shards(
+    test_cases_path: str,
+    output_dir: str,
+    count: int,
+    workers: int | None = None,
+    tiered: bool | None = None,
+    compress: bool = False,
+) -> dict:
+    """本地进程池同时运行全部 N 个分片，再合并为一份结果"""
+    run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    shard_paths = [str(shard_output_path(output_dir, run_id, i, count, compress)) for i in range(count)]
+
+    # spawn：每个分片是干净的解释器，不继承父进程的事件循环和 SDK 状态
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or count, mp_context=ctx) as pool:
+        futures = [
+            pool.submit(_run_shard, test_cases_path, shard_paths[i], i, count, tiered)
+            for i in range(count)
+        ]
+        for future in futures:
+            future.result()
+
+    suffix = ".jsonl.gz" if compress else ".jsonl"
+    return merge_and_report(test_cases_path, shard_paths, Path(output_dir) / f"eval_results_{run_id}{suffix}")
+
+
+def merge_and_report(test_cases_path: str, shard_paths: list[str], output_path: str | Path) -> dict:
+    """流式合并分片结果，输出与串行运行一致的结果文件和汇总
+
+    先写临时文件，合并校验通过后再改名，缺失 / 重复时不会留下不完整的结果文件
+    """
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + ".tmp" + (".gz" if output_path.suffix == ".gz" else ""))
+    aggregator = EvalAggregator()
+    try:
+        with ResultsWriter(tmp_path) as writer:
+            for r in merge_shard_results(load_cases(test_cases_path), shard_paths):
+                aggregator.add(r)
+                writer.write(r)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    tmp_path.replace(output_path)
+
+    summary = aggregator.summary()
+    print_summary(summary, output_path)
+    print(f"\n结果已保存: {output_path}")
+    return summary
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    default_cases = Path(__file__).parent.parent / "eval" / "test_cases.json"
+    default_output = Path(__file__).parent.parent / "eval" / "results"
+
+    parser = argparse.ArgumentParser(description="RunAI Agent 评测")
+    parser.add_argument("--cases", default=str(default_cases), help="测试用例文件")
+    parser.add_argument("--output-dir", default=str(default_output), help="结果目录")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--shard", help="只运行一个分片，格式 i/N（多机部署时每台机器跑一片）")
+    group.add_argument("--shards", type=int, help="本地进程池并行运行 N 个分片并自动合并")
+    group.add_argument("--merge", nargs="+", metavar="SHARD_FILE", help="合并已有的分片结果文件")
+    group.add_argument("--compare-tiered", action="store_true", help="每个用例分别以单模型和分层模式运行并对比")
+    parser.add_argument("--tiered", action="store_true", help="以分层模式运行（FAST_MODEL 规划 + LLM_MODEL 综合）")
+    parser.add_argument("--output", help="结果文件路径（默认在 output-dir 下自动命名）")
+    parser.add_argument("--workers", type=int, help="--shards 模式下的进程数（默认 N）")
+    parser.add_argument("--compress", action="store_true", help="结果文件用 gzip 压缩（.jsonl.gz）")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    shard = parse_shard(args.shard) if args.shard else None
+
+    if args.output:
+        output_path = args.output
+    elif shard:
+        output_path = str(shard_output_path(args.output_dir, run_id, *shard, compress=args.compress))
+    else:
+        suffix = ".jsonl.gz" if args.compress else ".jsonl"
+        output_path = str(Path(args.output_dir) / f"eval_results_{run_id}{suffix}")
+
+    print(f"Test cases: {args.cases}")
+    print(f"Output dir: {args.output_dir}")
+
+    # 合并不需要 API key
+    if args.merge:
+        merge_and_report(args.cases, args.merge, output_path)
+        sys.exit(0)
 
     # Check environment
-    required_vars = ["LANGSMITH_API_KEY", "TAVILY_API_KEY", "SERPAPI_KEY"]
+    required_vars = ["TAVILY_API_KEY", "SERPAPI_KEY"]
+    if LANGSMITH_TRACE_MODE != "off":
+        required_vars.insert(0, "LANGSMITH_API_KEY")
     missing = [v for v in required_vars if not os.environ.get(v)]
 
     if missing:
@@ -155,4 +380,10 @@ if __name__ == "__main__":
         sys.exit(1)
 
     # Run evaluation
-    asyncio.run(run_eval(str(test_cases_path), str(output_dir)))
+    tiered = True if args.tiered else None
+    if args.compare_tiered:
+        asyncio.run(run_compare(args.cases, args.output or str(Path(args.output_dir) / f"eval_compare_{run_id}.json")))
+    elif args.shards:
+        run_shards(args.cases, args.output_dir, args.shards, args.workers, tiered, args.compress)
+    else:
+        asyncio.run(run_eval(args.cases, shard=shard, output_path=output_path, tiered=tiered))
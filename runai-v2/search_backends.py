@@ -0,0 +1,272 @@
+"""RunAI 搜索后端 - 可插拔的搜索提供方 + 主备 / 竞速路由
+[I N P U T]: config.py 的 TAVILY_* / SEARCH_* 配置，corpus.py 的本地语料库
+[O U T P U T]: 对外提供 SearchBackend, TavilyBackend, CorpusBackend, SearchRouter, build_backends()
+[P O S]: runai-v2/ 的搜索接入层，tavily_search 经 SearchRouter 分发，单个慢提供方不再决定搜索延迟
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import httpx
+
+from config import (
+    CORPUS_ENABLED,
+    CORPUS_MAX_AGE_DAYS,
+    SEARCH_BACKEND_TIMEOUT,
+    SEARCH_MIN_RESULTS,
+    SEARCH_MODE,
+    SEARCH_RACE_N,
+    SEARCH_STANDIN_URL,
+    TAVILY_API_URL,
+    logger,
+)
+from corpus import get_corpus
+
+# 统计延迟分位数时保留的最近样本数
+LATENCY_WINDOW = 500
+
+# 每个远程请求发出前的回调（记上游请求数 / 取限流令牌）
+OnRequest = Callable[[], Awaitable[None]]
+
+_SITE_FILTER_RE = re.compile(r"\s*\((?:site:\S+(?:\s+OR\s+)?)+\)")
+
+
+class SearchBackend:
+    """搜索提供方接口：返回 Tavily 格式的 dict（answer + results[title/url/content/score]）
+
+    新的提供方继承这个类，实现 search()，需要配置才能用时覆盖 available()；
+    remote=False 的本地后端不计入上游请求数和限流配额
+    """
+    name = "base"
+    remote = True
+
+    def available(self) -> bool:
+        return True
+
+    async def search(self, client: httpx.AsyncClient, query: str, max_results: int) -> dict:
+        raise NotImplementedError
+
+
+class TavilyBackend(SearchBackend):
+    """Tavily API，或任何兼容 Tavily 请求格式的 HTTP 服务（如 standin_server.py 的本地替身）"""
+
+    def __init__(self, name: str = "tavily", url: str = TAVILY_API_URL, api_key_env: str = "TAVILY_API_KEY"):
+        self.name = name
+        self.url = url
+        self.api_key_env = api_key_env
+
+    def available(self) -> bool:
+        return bool(self.url) and (not self.api_key_env or bool(os.environ.get(self.api_key_env)))
+
+    async def search(self, client: httpx.AsyncClient, query: str, max_results: int) -> dict:
+        response = await client.post(
+            self.url,
+            json={
+                "api_key": os.environ.get(self.api_key_env, "") if self.api_key_env else "",
+                "query": query,
+                "max_results": max_results,
+                "include_answer": True,
+                "include_raw_content": False,
+                "include_images": False,
+            },
+            timeout=SEARCH_BACKEND_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+class CorpusBackend(SearchBackend):
+    """本地评测语料库（corpus.py），毫秒级，适合作为竞速里的快速候选或网络失败时的兜底"""
+    name = "corpus"
+    remote = False
+
+    def available(self) -> bool:
+        return CORPUS_ENABLED
+
+    async def search(self, client: httpx.AsyncClient, query: str, max_results: int) -> dict:
+        # site: 过滤是给网络搜索的，本地检索只用关键词
+        keywords = _SITE_FILTER_RE.sub("", query)
+        hits = await asyncio.to_thread(get_corpus().search, keywords, max_results, CORPUS_MAX_AGE_DAYS)
+        return {
+            "answer": "",
+            "results": [
+                {"title": h.title, "url": h.url, "content": h.snippet, "score": h.score, "fetched_at": h.fetched_at}
+                for h in hits
+            ],
+        }
+
+
+def build_backends(names: list[str]) -> list[SearchBackend]:
+    """按名字构造后端，顺序即优先级；未知名字跳过"""
+    factories = {
+        "tavily": lambda: TavilyBackend(),
+        "standin": lambda: TavilyBackend("standin", SEARCH_STANDIN_URL, api_key_env=""),
+        "corpus": lambda: CorpusBackend(),
+    }
+    backends = []
+    for name in names:
+        if name in factories:
+            backends.append(factories[name]())
+        else:
+            logger.warning("Search | unknown backend %r, skipped", name)
+    return backends
+
+
+class _BackendStats:
+    def __init__(self):
+        self.calls = 0
+        self.wins = 0
+        self.errors = 0
+        self.insufficient = 0
+        self.cancelled = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(p: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3) if ordered else 0.0
+
+        return {
+            "calls": self.calls,
+            "wins": self.wins,
+            "errors": self.errors,
+            "insufficient": self.insufficient,
+            "cancelled": self.cancelled,
+            "p50_seconds": pct(0.5),
+            "p95_seconds": pct(0.95),
+        }
+
+
+class SearchRouter:
+    """把一次查询分发给多个后端
+
+    - fallback：按顺序逐个尝试，返回第一个足够好的结果（主备）
+    - race：同时请求前 race_n 个可用后端，第一个足够好的结果胜出，其余取消
+    足够好 = 没有异常且结果数 >= min_results；都不够好时返回结果最多的那个，全部失败时抛出最后一个异常
+    返回的 dict 带 "backend" 字段标明结果来源；结果不够好、或来自主力之外的兜底后端时带 "degraded": True，
+    调用方不应长期缓存这种结果。
+    on_request 在每个远程请求真正发出前被 await 一次（竞速、兜底的每个后端都算），
+    调用方用它记上游请求数或取限流令牌
+    """
+
+    def __init__(self, backends: list[SearchBackend], mode: str = SEARCH_MODE,
+                 race_n: int = SEARCH_RACE_N, min_results: int = SEARCH_MIN_RESULTS):
+        self.backends = backends
+        self.mode = mode
+        self.race_n = race_n
+        self.min_results = min_results
+        self._stats = {b.name: _BackendStats() for b in backends}
+
+    def available(self) -> list[SearchBackend]:
+        return [b for b in self.backends if b.available()]
+
+    @staticmethod
+    def _count(data: dict) -> int:
+        return len(data.get("results") or [])
+
+    def _sufficient(self, data: dict) -> bool:
+        return self._count(data) >= self.min_results
+
+    async def _call(self, backend: SearchBackend, client: httpx.AsyncClient, query: str, max_results: int,
+                    on_request: OnRequest | None = None) -> dict:
+        if on_request is not None and backend.remote:
+            await on_request()
+        stats = self._stats[backend.name]
+        stats.calls += 1
+        started = time.perf_counter()
+        try:
+            data = await backend.search(client, query, max_results)
+        except asyncio.CancelledError:
+            stats.cancelled += 1
+            raise
+        except Exception:
+            stats.errors += 1
+            stats.latencies.append(time.perf_counter() - started)
+            raise
+        stats.latencies.append(time.perf_counter() - started)
+        if not self._sufficient(data):
+            stats.insufficient += 1
+        data["backend"] = backend.name
+        return data
+
+    async def search(self, client: httpx.AsyncClient, query: str, max_results: int,
+                     on_request: OnRequest | None = None) -> dict:
+        backends = self.available()
+        if not backends:
+            raise RuntimeError("no search backend available (check TAVILY_API_KEY / SEARCH_BACKENDS)")
+        if self.mode == "race" and len(backends) > 1:
+            primary, rest = backends[:self.race_n], backends[self.race_n:]
+            try:
+                data = await self._race(primary, client, query, max_results, on_request)
+            except Exception:
+                # 参赛的后端全部失败，剩下的按主备顺序兜底
+                if not rest:
+                    raise
+                data = await self._fallback(rest, client, query, max_results, on_request)
+            else:
+                # 竞速只拿到不够好的结果，剩下的后端也试一遍，取结果多的
+                if rest and not self._sufficient(data):
+                    try:
+                        other = await self._fallback(rest, client, query, max_results, on_request)
+                    except Exception as e:
+                        logger.info("Search | fallback after insufficient race failed: %s", e)
+                    else:
+                        if self._count(other) > self._count(data):
+                            data = other
+        else:
+            primary = backends[:1]
+            data = await self._fallback(backends, client, query, max_results, on_request)
+        data["degraded"] = not self._sufficient(data) or data["backend"] not in {b.name for b in primary}
+        self._stats[data["backend"]].wins += 1
+        return data
+
+    async def _fallback(self, backends, client, query, max_results, on_request=None) -> dict:
+        best: dict | None = None
+        last_exc: Exception | None = None
+        for backend in backends:
+            try:
+                data = await self._call(backend, client, query, max_results, on_request)
+            except Exception as e:
+                last_exc = e
+                logger.info("Search | %s failed, falling back: %s", backend.name, e)
+                continue
+            if self._sufficient(data):
+                return data
+            if best is None or self._count(data) > self._count(best):
+                best = data
+        if best is not None:
+            return best
+        raise last_exc
+
+    async def _race(self, backends, client, query, max_results, on_request=None) -> dict:
+        pending = {asyncio.ensure_future(self._call(b, client, query, max_results, on_request)) for b in backends}
+        best: dict | None = None
+        last_exc: Exception | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        last_exc = task.exception()
+                        continue
+                    data = task.result()
+                    if self._sufficient(data):
+                        return data
+                    if best is None or self._count(data) > self._count(best):
+                        best = data
+        finally:
+            for task in pending:
+                task.cancel()
+        if best is not None:
+            return best
+        raise last_exc
+
+    def stats(self) -> dict[str, dict]:
+        """各后端的调用数、胜出数、错误数和延迟分位数"""
+        return {name: s.summary() for name, s in self._stats.items()}
@@ -0,0 +1,76 @@
+"""RunAI 会话级工具状态 - 单次 run_agent 对话内的查询记忆
+[I N P U T]: 无外部依赖，由 agent.py 的 run_agent 创建、tools.py 的工具处理器使用
+[O U T P U T]: 对外提供 ToolSession
+[P O S]: runai-v2/ 的会话层，位于全局缓存（cache.py）之前，同一对话重复查询直接复用
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from config import logger
+
+
+class ToolSession:
+    """一次对话的工具调用记忆
+
+    以 (namespace, key) 记录上游请求的 Task，而不是结果：
+    - 已完成的请求直接返回结果
+    - 进行中的请求（同一批次重复查询）共享同一个 Task，不会重复打上游
+    失败、取消或带 error 的结果会被移除，下次调用重新请求
+    """
+
+    def __init__(self):
+        self._memo: dict[tuple[str, Hashable], asyncio.Task] = {}
+        self.stats: dict[str, dict[str, Any]] = {}
+        self.upstream_requests = 0  # 缓存未命中、真正打到上游的请求数（预算用）
+        self.prefetch_requests = 0  # 投机预取打到上游的请求数（不计入预算，只做统计）
+
+    async def fetch(self, namespace: str, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """返回 (结果, 是否来自会话记忆)"""
+        memo_key = (namespace, key)
+        task = self._memo.get(memo_key)
+        served = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._memo[memo_key] = task
+            task.add_done_callback(lambda t: self._evict_failed(memo_key, t))
+        # shield：调用方被取消时，共享的请求继续完成
+        return await asyncio.shield(task), served
+
+    def _evict_failed(self, memo_key: tuple[str, Hashable], task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            self._memo.pop(memo_key, None)
+            return
+        result = task.result()
+        if isinstance(result, dict) and result.get("error"):
+            self._memo.pop(memo_key, None)
+
+    def record(self, tool_name: str, served: list[str], fetched: list[str], output_chars: int = 0):
+        """记录一次工具调用中哪些查询来自会话记忆、哪些新请求了上游，以及返回给模型的文本长度"""
+        entry = self.stats.setdefault(tool_name, {"served": [], "fetched": [], "calls": 0, "output_chars": 0})
+        entry["served"].extend(served)
+        entry["fetched"].extend(fetched)
+        entry["calls"] += 1
+        entry["output_chars"] += output_chars
+        if served:
+            logger.info("SessionMemo | %s served %d/%d from session: %s",
+                        tool_name, len(served), len(served) + len(fetched), served)
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        return {
+            name: {
+                "calls": entry["calls"],
+                "served": len(entry["served"]),
+                "fetched": len(entry["fetched"]),
+                "output_chars": entry["output_chars"],
+            }
+            for name, entry in self.stats.items()
+        }
+
+    def close(self):
+        """对话结束时取消仍在进行的请求"""
+        for task in self._memo.values():
+            if not task.done():
+                task.cancel()
+        self._memo.clear()
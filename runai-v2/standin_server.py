@@ -0,0 +1,169 @@
+"""RunAI 本地上游替身 - Tavily / SerpAPI 兼容的假接口
+[I N P U T]: 无外部依赖，仅标准库 http.server
+[O U T P U T]: 对外提供 StandInServer（线程内运行），以及独立运行入口
+[P O S]: runai-v2/ 的测试设施，压测时替代真实搜索/购物 API，不消耗配额
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SAMPLE_DOMAINS = [
+    "runrepeat.com",
+    "believeintherun.com",
+    "doctorsofrunning.com",
+    "reddit.com/r/runningshoegeeks",
+    "solereview.com",
+]
+
+
+def _seed(text: str) -> int:
+    """同一查询返回同样的结果，方便比对"""
+    return int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:4], "big")
+
+
+def fake_tavily_response(query: str, max_results: int = 5) -> dict:
+    seed = _seed(query)
+    results = []
+    for i in range(max_results):
+        domain = SAMPLE_DOMAINS[(seed + i) % len(SAMPLE_DOMAINS)]
+        results.append({
+            "title": f"{query} review #{i + 1}",
+            "url": f"https://{domain}/review/{seed % 10000}-{i}",
+            "score": round(0.95 - i * 0.07, 2),
+            "content": f"Stand-in review snippet for {query}. " * 8,
+        })
+    return {"query": query, "answer": f"Stand-in answer for {query}.", "results": results}
+
+
+def fake_shopping_response(q: str) -> dict:
+    seed = _seed(q)
+    return {
+        "shopping_results": [
+            {
+                "title": f"{q} (variant {i + 1})",
+                "price": f"${120 + (seed + i * 13) % 80}.00",
+                "source": "Stand-in Store",
+                "rating": 4.5,
+                "reviews": 100 + i,
+                "product_link": f"https://example.com/p/{seed % 10000}-{i}",
+                "immersive_product_page_token": f"tok-{seed % 10000}-{i}",
+            }
+            for i in range(3)
+        ]
+    }
+
+
+def fake_immersive_response(page_token: str) -> dict:
+    return {
+        "product_results": {
+            "stores": [
+                {"name": name, "price": "$139.95", "link": f"https://{name.lower()}.example.com/{page_token}"}
+                for name in ("Amazon", "Zappos", "Running Warehouse")
+            ]
+        }
+    }
+
+
+class StandInServer:
+    """在后台线程里运行的替身服务
+
+    - POST /search          → Tavily 格式
+    - GET  /serpapi/search  → SerpAPI 格式（按 engine 区分列表页/详情页）
+    latency 模拟上游耗时，在服务端线程里 sleep，不占用被测进程的事件循环
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.3):
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def tavily_url(self) -> str:
+        return f"{self.base_url}/search"
+
+    @property
+    def serpapi_url(self) -> str:
+        return f"{self.base_url}/serpapi/search"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, payload: dict, status: int = 200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _count(self):
+                with server._lock:
+                    server.request_count += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/search":
+                    return self._reply({"error": "not found"}, 404)
+                self._count()
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                self._reply(fake_tavily_response(body.get("query", ""), int(body.get("max_results", 5))))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/serpapi/search":
+                    return self._reply({"error": "not found"}, 404)
+                self._count()
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if params.get("engine") == "google_immersive_product":
+                    return self._reply(fake_immersive_response(params.get("page_token", "")))
+                self._reply(fake_shopping_response(params.get("q", "")))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tavily / SerpAPI 本地替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟上游耗时（秒）")
+    args = parser.parse_args()
+
+    server = StandInServer(args.host, args.port, args.latency)
+    print(f"TAVILY_API_URL={server.tavily_url}")
+    print(f"SERPAPI_URL={server.serpapi_url}")
+    server._httpd.serve_forever()
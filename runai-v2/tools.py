@@ -1,27 +1,59 @@
 """RunAI Agent 工具定义 - Tavily 搜索 & Google Shopping
 [I N P U T]: 依赖 os.environ 的 API keys (TAVILY_API_KEY, SERPAPI_KEY)
-[O U T P U T]: 对外提供 tavily_search, google_shopping 异步函数
-[P O S]: runai-v2/ 的工具层，处理所有外部 API 调用
+[O U T P U T]: 对外提供 local_review_search, tavily_search, google_shopping 工具，绑定会话的 create_session_tools，以及 prefetch_shopping
+[C A C H E]: 会话记忆（session.py）→ 全局 TTL 缓存（cache.py）→ 上游；热门查询由后台预热任务在过期前刷新
+[C O R P U S]: tavily_search 的结果写入本地语料库（corpus.py），local_review_search 离线检索
+[S E A R C H]: tavily_search 经 search_backends.py 的 SEARCH_ROUTER 分发（Tavily / 本地替身 / 语料库，主备或竞速）
+[P O S]: runai-v2/ 的工具层，处理所有外部 API 调用，产出 records.py 的结构化记录后统一渲染
 [P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
 """
 
 import os
 import json
 import asyncio
+import functools
 import httpx
 from typing import Any
-from claude_agent_sdk import tool
-
+from claude_agent_sdk import SdkMcpTool, tool
+
+from cache import TTLCache, RateLimiter, RefreshAheadWarmer
+from corpus import get_corpus
+from records import (
+    SearchResult,
+    ShoppingResult,
+    Product,
+    StoreLink,
+    render_search,
+    render_shopping,
+)
+from search_backends import SearchRouter, build_backends
+from session import ToolSession
 from config import (
     TAVILY_CONCURRENCY,
-    TAVILY_TIMEOUT,
     TAVILY_MAX_RESULTS,
     TAVILY_HIGH_PRIORITY_SOURCES,
+    SERPAPI_URL,
     SHOPPING_CONCURRENCY,
     SHOPPING_TIMEOUT,
     SHOPPING_RETRY_ATTEMPTS,
     SHOPPING_RETRY_DELAY,
     SHOPPING_MAX_PRODUCTS,
+    TAVILY_CACHE_TTL,
+    SHOPPING_CACHE_TTL,
+    CACHE_MAX_ENTRIES,
+    REFRESH_AHEAD_ENABLED,
+    REFRESH_AHEAD_TOP_K,
+    REFRESH_AHEAD_WINDOW,
+    REFRESH_AHEAD_INTERVAL,
+    REFRESH_POPULARITY_HALF_LIFE,
+    TAVILY_RATE_LIMIT_PER_MIN,
+    SHOPPING_RATE_LIMIT_PER_MIN,
+    REFRESH_QUOTA_SHARE,
+    TOOL_OUTPUT_FORMAT,
+    CORPUS_ENABLED,
+    CORPUS_MAX_RESULTS,
+    CORPUS_MAX_AGE_DAYS,
+    SEARCH_BACKENDS,
     logger,
 )
 
@@ -44,9 +76,269 @@ def parse_list_param(value: Any) -> list | None:
     return None
 
 
-@tool(
-    "tavily_search",
-    """Search the web using Tavily API. Best for:
+# ============================================================
+# 上游请求 & 缓存 - Upstream Requests & Cache
+# ============================================================
+
+# tavily_search 的上游：按 SEARCH_BACKENDS / SEARCH_MODE 分发
+SEARCH_ROUTER = SearchRouter(build_backends(SEARCH_BACKENDS))
+
+# key: (search_query, max_results)
+TAVILY_CACHE = TTLCache("tavily", TAVILY_CACHE_TTL, CACHE_MAX_ENTRIES)
+# key: (规范化 q, tbs)，第一步商品列表；预热刷新列表时连同新 page_token 的卖家详情一起刷新
+SHOPPING_CACHE = TTLCache("shopping", SHOPPING_CACHE_TTL, CACHE_MAX_ENTRIES)
+# key: page_token，第二步卖家详情（page_token 每次列表响应都会变，不单独预热）
+PRODUCT_CACHE = TTLCache("product", SHOPPING_CACHE_TTL, CACHE_MAX_ENTRIES)
+
+
+async def _get_with_retry(client: httpx.AsyncClient, url: str, params: dict, attempts: int = SHOPPING_RETRY_ATTEMPTS) -> dict:
+    """429 时短暂重试后降级返回错误，非 429 错误也会重试"""
+    delay = SHOPPING_RETRY_DELAY
+    last_exc: Exception | None = None
+    for k in range(attempts):
+        try:
+            resp = await client.get(url, params=params)
+            if resp.status_code == 429:
+                if k < attempts - 1:
+                    wait_time = delay * (k + 1)
+                    logger.warning("Shopping API | 429 rate limited, retry in %ss...", wait_time)
+                    await asyncio.sleep(wait_time)
+                    delay *= 1.5
+                    continue
+                return {"error": "RATE_LIMIT", "detail": "Google Shopping API rate limited"}
+            resp.raise_for_status()
+            return resp.json()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                if k < attempts - 1:
+                    await asyncio.sleep(delay)
+                    continue
+                return {"error": "RATE_LIMIT", "detail": "Google Shopping API rate limited"}
+            raise
+        except Exception as e:
+            last_exc = e
+            if k < attempts - 1:
+                await asyncio.sleep(delay)
+                delay *= 1.6
+    raise last_exc if last_exc else RuntimeError("request failed")
+
+
+# 进程内所有 SerpAPI 请求（工具调用、投机预取、商品详情、预热）共用的并发上限，
+# 只包住单次 HTTP 请求，列表和详情两步不会互相占着名额等待
+_SERPAPI_SEMAPHORE = asyncio.Semaphore(SHOPPING_CONCURRENCY)
+
+
+async def _serpapi_get(client: httpx.AsyncClient, params: dict) -> dict:
+    async with _SERPAPI_SEMAPHORE:
+        return await _get_with_retry(client, SERPAPI_URL, params)
+
+
+def _shopping_params(api_key: str, q: str, tbs: str) -> dict:
+    params = {
+        "api_key": api_key,
+        "engine": "google_shopping",
+        "q": q,
+        "location": "United States",
+        "hl": "en",
+        "gl": "us",
+    }
+    if tbs:
+        params["tbs"] = tbs
+    return params
+
+
+def _shopping_key(q: str, tbs: str) -> tuple[str, str]:
+    """商品列表的缓存 key：忽略大小写和空白差异，"HOKA  Bondi 8" 与 "Hoka Bondi 8" 共用结果"""
+    return " ".join(q.lower().split()), tbs
+
+
+def _product_params(api_key: str, page_token: str) -> dict:
+    return {
+        "api_key": api_key,
+        "engine": "google_immersive_product",
+        "page_token": page_token,
+        "hl": "en",
+        "gl": "us",
+    }
+
+
+async def _cached(cache: TTLCache, key, fetch, session: ToolSession | None = None,
+                  count_upstream: bool = True) -> tuple[dict, bool]:
+    """会话记忆 → 全局缓存 → 上游，返回 (数据, 是否来自会话记忆)
+
+    带 error 的响应和降级结果（SearchRouter 标记的 degraded）不进全局缓存，只留在会话记忆里；
+    一次 fetch 会发出多个请求时传 count_upstream=False，由 fetch 自己计入 session.upstream_requests
+    """
+    async def load() -> dict:
+        data = cache.get(key)
+        if data is None:
+            if session is not None and count_upstream:
+                session.upstream_requests += 1
+            data = await fetch()
+            if not data.get("error") and not data.get("degraded"):
+                cache.set(key, data)
+        return data
+
+    if session is None:
+        return await load(), False
+    return await session.fetch(cache.name, key, load)
+
+
+async def _refresh_tavily(key: tuple[str, int]) -> dict | None:
+    if not SEARCH_ROUTER.available():
+        return None
+    async with httpx.AsyncClient() as client:
+        # 竞速 / 兜底会发出多个请求，每个都从预热配额里取令牌
+        data = await SEARCH_ROUTER.search(client, *key, on_request=_TAVILY_REFRESH_LIMITER.acquire)
+    # 降级结果不覆盖旧条目，让它按原 TTL 过期，下次请求再走完整路由
+    return None if data.get("degraded") else data
+
+
+async def _refresh_shopping(key: tuple[str, str]) -> dict | None:
+    """刷新商品列表，并按新的 page_token 预取卖家详情，否则请求路径上第二步仍然全部未命中"""
+    api_key = os.environ.get("SERPAPI_KEY")
+    if not api_key:
+        return None
+    async with httpx.AsyncClient(timeout=SHOPPING_TIMEOUT) as client:
+        data = await _serpapi_get(client, _shopping_params(api_key, *key))
+        if data.get("error"):
+            return None
+        for p in data.get("shopping_results", [])[:SHOPPING_MAX_PRODUCTS]:
+            token = p.get("immersive_product_page_token")
+            if not token:
+                continue
+            # 详情请求同样计入预热配额
+            await _SHOPPING_REFRESH_LIMITER.acquire()
+            try:
+                detail = await _serpapi_get(client, _product_params(api_key, token))
+            except Exception as e:
+                logger.debug("Warmer | product detail refresh failed: %s", e)
+                continue
+            if not detail.get("error"):
+                PRODUCT_CACHE.set(token, detail)
+    return data
+
+
+_TAVILY_REFRESH_LIMITER = RateLimiter(TAVILY_RATE_LIMIT_PER_MIN * REFRESH_QUOTA_SHARE / 60)
+_SHOPPING_REFRESH_LIMITER = RateLimiter(SHOPPING_RATE_LIMIT_PER_MIN * REFRESH_QUOTA_SHARE / 60)
+
+_WARMERS = [
+    RefreshAheadWarmer(
+        TAVILY_CACHE,
+        _refresh_tavily,
+        None,  # _refresh_tavily 按实际发出的请求取令牌
+        REFRESH_AHEAD_TOP_K,
+        REFRESH_AHEAD_WINDOW,
+        REFRESH_AHEAD_INTERVAL,
+        REFRESH_POPULARITY_HALF_LIFE,
+    ),
+    RefreshAheadWarmer(
+        SHOPPING_CACHE,
+        _refresh_shopping,
+        _SHOPPING_REFRESH_LIMITER,
+        REFRESH_AHEAD_TOP_K,
+        REFRESH_AHEAD_WINDOW,
+        REFRESH_AHEAD_INTERVAL,
+        REFRESH_POPULARITY_HALF_LIFE,
+    ),
+]
+
+
+def ensure_warmers_started():
+    """在当前事件循环上启动预热任务（首次调用工具时触发，重复调用无副作用）"""
+    if not REFRESH_AHEAD_ENABLED:
+        return
+    for warmer in _WARMERS:
+        warmer.start()
+
+
+# ============================================================
+# 本地语料库 - Local Review Corpus
+# ============================================================
+
+# 后台写入任务的引用，防止被 GC 提前回收
+_corpus_writes: set[asyncio.Task] = set()
+
+
+def _ingest(records: list[SearchResult]):
+    """把搜索结果异步写入本地语料库，不阻塞工具返回"""
+    if not CORPUS_ENABLED:
+        return
+    # 只收真实 Tavily 的结果：语料库后端的结果本来就在库里（重复写入只会把旧片段的 fetched_at 刷新成现在），
+    # standin 等替身返回的是假片段
+    records = [r for r in records if r.backend == "tavily"]
+    if not records:
+        return
+
+    async def write():
+        try:
+            added = await asyncio.to_thread(get_corpus().add_results, records)
+            if added:
+                logger.debug("Corpus | +%d snippets", added)
+        except Exception as e:
+            logger.warning("Corpus | ingest failed: %s", e)
+
+    task = asyncio.create_task(write())
+    _corpus_writes.add(task)
+    task.add_done_callback(_corpus_writes.discard)
+
+
+LOCAL_REVIEW_SEARCH_DESCRIPTION = """Search the local review corpus (offline, millisecond latency).
+
+The corpus accumulates review snippets from earlier web searches (RunRepeat, Reddit, Believe in the Run, etc.),
+ranked by BM25 with priority sources boosted. Each hit shows when it was fetched.
+
+Try this FIRST for popular shoes. If hits are missing, off-topic or too old, fall back to web search.
+
+Input:
+- queries (list[str]): English keywords work best, e.g. ["Bondi 8 heavy runner", "Nimbus 26 durability"]
+- max_results (int, optional)"""
+
+LOCAL_REVIEW_SEARCH_SCHEMA = {
+    "queries": list,
+    "max_results": int,
+}
+
+
+async def _local_review_search(args: dict[str, Any], session: ToolSession | None = None) -> dict[str, Any]:
+    """Search the local SQLite FTS5 review corpus"""
+    queries = parse_list_param(args.get("queries"))
+    max_results = args.get("max_results", CORPUS_MAX_RESULTS)
+
+    if not queries:
+        return {"content": [{"type": "text", "text": "Error: queries is required and must be a list of strings"}]}
+
+    targets = list(dict.fromkeys(s.strip() for s in queries if isinstance(s, str) and s.strip()))
+    if not targets:
+        return {"content": [{"type": "text", "text": "Error: queries must be a non-empty list of strings"}]}
+
+    if not CORPUS_ENABLED:
+        return {"content": [{"type": "text", "text": "Error: local corpus disabled, use web search"}]}
+
+    try:
+        corpus = get_corpus()
+        records = []
+        for q in targets:
+            hits = await asyncio.to_thread(corpus.search, q, min(max_results, 20), CORPUS_MAX_AGE_DAYS)
+            records.append(SearchResult(query=q, hits=hits))
+        output = render_search(records, TOOL_OUTPUT_FORMAT)
+        empty = [r.query for r in records if not r.hits]
+        if empty:
+            output += f"\n\nNo local hits for {empty} - use web search for these."
+
+        if session is not None:
+            session.record("local_review_search", [], targets, len(output))
+        return {"content": [{"type": "text", "text": output}]}
+
+    except Exception as e:
+        return {"content": [{"type": "text", "text": f"Local review search failed: {str(e)}"}]}
+
+
+# ============================================================
+# 网络搜索 & 比价 - Web Search & Shopping
+# ============================================================
+
+TAVILY_SEARCH_DESCRIPTION = """Search the web using Tavily API. Best for:
 - Running shoe reviews from RunRepeat, Believe in the Run, Doctors of Running
 - Reddit discussions from r/running, r/runningshoegeeks
 - Expert comparisons and analysis
@@ -57,15 +349,17 @@ Supports:
 
 Tips:
 - Use "vs" for comparisons (e.g., "Bondi 8 vs Nimbus 26")
-- Add sources="high_priority" for prioritized reviews from RunRepeat, Reddit, etc.""",
-    {
-        "queries": list,
-        "sources": list,
-        "max_results": int,
-    },
-)
-async def tavily_search(args: dict[str, Any]) -> dict[str, Any]:
-    """Search using Tavily API, supports batch queries with internal concurrency and priority sources"""
+- Add sources="high_priority" for prioritized reviews from RunRepeat, Reddit, etc."""
+
+TAVILY_SEARCH_SCHEMA = {
+    "queries": list,
+    "sources": list,
+    "max_results": int,
+}
+
+
+async def _tavily_search(args: dict[str, Any], session: ToolSession | None = None) -> dict[str, Any]:
+    """Web search through SEARCH_ROUTER (Tavily by default), supports batch queries with internal concurrency and priority sources"""
     queries = parse_list_param(args.get("queries"))
     sources = args.get("sources")
     max_results = args.get("max_results", TAVILY_MAX_RESULTS)
@@ -74,19 +368,28 @@ async def tavily_search(args: dict[str, Any]) -> dict[str, Any]:
     if not queries:
         return {"content": [{"type": "text", "text": "Error: queries is required and must be a list (got: " + str(type(args.get("queries"))) + ")"}]}
 
-    targets = [s.strip() for s in queries if isinstance(s, str) and s.strip()]
+    # 去重：同一批次里重复的查询只请求一次
+    targets = list(dict.fromkeys(s.strip() for s in queries if isinstance(s, str) and s.strip()))
     if not targets:
         return {"content": [{"type": "text", "text": "Error: queries must be a non-empty list of strings"}]}
 
-    api_key = os.environ.get("TAVILY_API_KEY")
-    if not api_key:
-        return {"content": [{"type": "text", "text": "Error: TAVILY_API_KEY not configured"}]}
+    if not SEARCH_ROUTER.available():
+        return {"content": [{"type": "text", "text": "Error: no search backend configured (TAVILY_API_KEY not set?)"}]}
+
+    ensure_warmers_started()
+    served: list[str] = []
+    fetched: list[str] = []
+
+    async def count_request():
+        # 路由在竞速 / 兜底时会请求多个后端，每个远程请求都计入预算
+        if session is not None:
+            session.upstream_requests += 1
 
     try:
         async with httpx.AsyncClient() as client:
             sem = asyncio.Semaphore(TAVILY_CONCURRENCY)
 
-            async def search_one(q: str) -> str:
+            async def search_one(q: str) -> SearchResult:
                 async with sem:
                     # Add source filter if specified
                     search_query = q
@@ -97,49 +400,34 @@ async def tavily_search(args: dict[str, Any]) -> dict[str, Any]:
                         site_filter = " OR ".join([f"site:{s}" for s in TAVILY_HIGH_PRIORITY_SOURCES])
                         search_query = f"{q} ({site_filter})"
 
-                    response = await client.post(
-                        "https://api.tavily.com/search",
-                        json={
-                            "api_key": api_key,
-                            "query": search_query,
-                            "max_results": min(max_results, 10),
-                            "include_answer": True,
-                            "include_raw_content": False,
-                            "include_images": False,
-                        },
-                        timeout=TAVILY_TIMEOUT
+                    n = min(max_results, 10)
+                    data, from_session = await _cached(
+                        TAVILY_CACHE,
+                        (search_query, n),
+                        lambda: SEARCH_ROUTER.search(client, search_query, n, on_request=count_request),
+                        session,
+                        count_upstream=False,
                     )
-                    response.raise_for_status()
-                    data = response.json()
-
-                    output = f'## Search Results for "{q}"\n\n'
-                    if data.get("answer"):
-                        output += f"### Answer\n\n{data['answer']}\n\n"
-
-                    for i, r in enumerate(data.get("results", []), 1):
-                        output += f"**{i}. {r.get('title', 'N/A')}**\n"
-                        output += f"URL: {r.get('url', 'N/A')}\n"
-                        output += f"Score: {r.get('score', 0):.2f}\n"
-                        output += f"{r.get('content', '')[:300]}\n\n---\n\n"
-                    return output
+                    (served if from_session else fetched).append(q)
+                    return SearchResult.from_tavily(q, data)
 
             results = await asyncio.gather(*[search_one(t) for t in targets], return_exceptions=True)
-            output = ""
-            for r, t in zip(results, targets):
-                if isinstance(r, Exception):
-                    output += f'## Search Results for "{t}"\n\nError: {str(r)}\n\n'
-                else:
-                    output += r
-
+            records = [
+                SearchResult(query=t, error=str(r)) if isinstance(r, Exception) else r
+                for r, t in zip(results, targets)
+            ]
+            output = render_search(records, TOOL_OUTPUT_FORMAT)
+            _ingest(records)
+
+            if session is not None:
+                session.record("tavily_search", served, fetched, len(output))
             return {"content": [{"type": "text", "text": output}]}
 
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Tavily search failed: {str(e)}"}]}
 
 
-@tool(
-    "google_shopping",
-    """Search Google Shopping for running shoe prices and purchase links (US market).
+GOOGLE_SHOPPING_DESCRIPTION = """Search Google Shopping for running shoe prices and purchase links (US market).
 
 Input:
 - queries (list): List of specific shoe model names, e.g. ["HOKA Bondi 9", "ASICS Gel-Nimbus 27"]
@@ -151,14 +439,16 @@ Returns:
 - Direct purchase links to retailers (Amazon, Zappos, etc.)
 - Rating and review count
 
-IMPORTANT: Only use specific shoe model names. Do NOT use generic terms like "best running shoes".""",
-    {
-        "queries": list,
-        "max_price": int,
-        "min_price": int,
-    },
-)
-async def google_shopping(args: dict[str, Any]) -> dict[str, Any]:
+IMPORTANT: Only use specific shoe model names. Do NOT use generic terms like "best running shoes"."""
+
+GOOGLE_SHOPPING_SCHEMA = {
+    "queries": list,
+    "max_price": int,
+    "min_price": int,
+}
+
+
+async def _google_shopping(args: dict[str, Any], session: ToolSession | None = None) -> dict[str, Any]:
     """Search Google Shopping via SerpAPI with two-step lookup, supporting batch queries with bounded concurrency and light retry"""
     queries = parse_list_param(args.get("queries"))
     max_price = args.get("max_price")
@@ -167,7 +457,7 @@ async def google_shopping(args: dict[str, Any]) -> dict[str, Any]:
     if not queries:
         return {"content": [{"type": "text", "text": "Error: queries is required and must be a list of shoe names"}]}
 
-    targets = [s.strip() for s in queries if isinstance(s, str) and s.strip()]
+    targets = list(dict.fromkeys(s.strip() for s in queries if isinstance(s, str) and s.strip()))
     if not targets:
         return {"content": [{"type": "text", "text": "Error: queries must be a non-empty list of strings"}]}
 
@@ -175,129 +465,142 @@ async def google_shopping(args: dict[str, Any]) -> dict[str, Any]:
     if not api_key:
         return {"content": [{"type": "text", "text": "Error: SERPAPI_KEY not configured"}]}
 
+    ensure_warmers_started()
+    served: list[str] = []
+    fetched: list[str] = []
+
+    tbs = ""
+    if max_price or min_price:
+        tbs = "mr:1,price:1"
+        if min_price:
+            tbs += f",ppr_min:{min_price}"
+        if max_price:
+            tbs += f",ppr_max:{max_price}"
+
     try:
         async with httpx.AsyncClient(timeout=SHOPPING_TIMEOUT) as client:
-            sem = asyncio.Semaphore(SHOPPING_CONCURRENCY)
-
-            async def get_with_retry(url: str, params: dict, attempts: int = SHOPPING_RETRY_ATTEMPTS) -> dict:
-                """429 时短暂重试后降级返回错误，非 429 错误也会重试"""
-                delay = SHOPPING_RETRY_DELAY
-                last_exc: Exception | None = None
-                for k in range(attempts):
+            async def handle_one(q: str) -> ShoppingResult:
+                # Step 1: Google Shopping API - 获取商品列表和 product_id
+                data, from_session = await _cached(
+                    SHOPPING_CACHE,
+                    _shopping_key(q, tbs),
+                    lambda: _serpapi_get(client, _shopping_params(api_key, q, tbs)),
+                    session,
+                )
+                (served if from_session else fetched).append(q)
+                # 处理 429 降级情况
+                if data.get("error") == "RATE_LIMIT":
+                    return ShoppingResult(query=q, rate_limited=True)
+                if data.get("error"):
+                    return ShoppingResult(query=q, error=f"SerpAPI error: {data['error']}")
+
+                raw_products = data.get("shopping_results", [])[:SHOPPING_MAX_PRODUCTS]
+                products = [Product.from_serpapi(p) for p in raw_products]
+
+                # Step 2: Google Immersive Product API - 获取卖家直链（各商品并发）
+                async def attach_stores(product: Product, page_token: str):
                     try:
-                        resp = await client.get(url, params=params)
-                        if resp.status_code == 429:
-                            if k < attempts - 1:
-                                wait_time = delay * (k + 1)
-                                logger.warning(f"Shopping API | 429 rate limited, retry in {wait_time}s...")
-                                await asyncio.sleep(wait_time)
-                                delay *= 1.5
-                                continue
-                            return {"error": "RATE_LIMIT", "detail": "Google Shopping API rate limited"}
-                        resp.raise_for_status()
-                        return resp.json()
-                    except httpx.HTTPStatusError as e:
-                        if e.response.status_code == 429:
-                            if k < attempts - 1:
-                                await asyncio.sleep(delay)
-                                continue
-                            return {"error": "RATE_LIMIT", "detail": "Google Shopping API rate limited"}
-                        raise
-                    except Exception as e:
-                        last_exc = e
-                        if k < attempts - 1:
-                            await asyncio.sleep(delay)
-                            delay *= 1.6
-                raise last_exc if last_exc else RuntimeError("request failed")
-
-            async def handle_one(q: str) -> str:
-                async with sem:
-                    # Step 1: Google Shopping API - 获取商品列表和 product_id
-                    params = {
-                        "api_key": api_key,
-                        "engine": "google_shopping",
-                        "q": q,
-                        "location": "United States",
-                        "hl": "en",
-                        "gl": "us",
-                    }
-                    if max_price or min_price:
-                        tbs = "mr:1,price:1"
-                        if min_price:
-                            tbs += f",ppr_min:{min_price}"
-                        if max_price:
-                            tbs += f",ppr_max:{max_price}"
-                        params["tbs"] = tbs
-
-                    data = await get_with_retry("https://serpapi.com/search", params)
-                    # 处理 429 降级情况
-                    if data.get("error") == "RATE_LIMIT":
-                        return f'## Google Shopping Results for "{q}"\n\n⚠️ **API Rate Limited** - Price lookup failed. Use Tavily to search for prices instead.\n\n'
-                    if data.get("error"):
-                        return f'## Google Shopping Results for "{q}"\n\nSerpAPI error: {data["error"]}\n'
-
-                    products = data.get("shopping_results", [])[:SHOPPING_MAX_PRODUCTS]
-                    if not products:
-                        return f'## Google Shopping Results for "{q}"\n\nNo products found for "{q}"\n'
-
-                    out = f'## Google Shopping Results for "{q}"\n\n'
-
-                    # Step 2: Google Immersive Product API - 获取卖家直链
-                    for i, p in enumerate(products, 1):
-                        page_token = p.get("immersive_product_page_token")
-                        title = p.get("title", "N/A")
-                        price = p.get("price") or p.get("extracted_price") or "N/A"
-                        source = p.get("source", "N/A")
-                        rating = p.get("rating")
-                        reviews = p.get("reviews", 0)
-                        thumbnail = p.get("thumbnail", "")
-
-                        out += f"### {i}. {title}\n"
-                        if thumbnail:
-                            out += f"![{title}]({thumbnail})\n"
-                        out += f"**Price**: {price}\n"
-                        out += f"**Source**: {source}\n"
-                        if rating:
-                            out += f"**Rating**: {rating} ({reviews} reviews)\n"
-
-                        if page_token:
-                            try:
-                                detail_params = {
-                                    "api_key": api_key,
-                                    "engine": "google_immersive_product",
-                                    "page_token": page_token,
-                                    "hl": "en",
-                                    "gl": "us",
-                                }
-                                detail_data = await get_with_retry("https://serpapi.com/search", detail_params)
-                                # 提取卖家列表 (stores 在 product_results.stores)
-                                stores = detail_data.get("product_results", {}).get("stores", [])
-                                if stores:
-                                    out += "**Purchase Links**:\n"
-                                    for store in stores[:3]:
-                                        name = store.get("name", "Unknown")
-                                        price_s = store.get("price") or store.get("base_price") or "N/A"
-                                        link = store.get("link", "N/A")
-                                        out += f"  - [{name}]({link}) - {price_s}\n"
-                                else:
-                                    out += f"**Link**: {p.get('product_link') or 'N/A'}\n"
-                            except Exception:
-                                out += f"**Link**: {p.get('product_link') or 'N/A'}\n"
-                        else:
-                            out += f"**Link**: {p.get('product_link') or 'N/A'}\n"
-                        out += "\n---\n\n"
-
-                    return out
+                        detail_data, _ = await _cached(
+                            PRODUCT_CACHE,
+                            page_token,
+                            lambda: _serpapi_get(client, _product_params(api_key, page_token)),
+                            session,
+                        )
+                    except Exception:
+                        return
+                    # 提取卖家列表 (stores 在 product_results.stores)
+                    for store in detail_data.get("product_results", {}).get("stores", [])[:3]:
+                        product.stores.append(StoreLink(
+                            name=store.get("name", "Unknown"),
+                            price=str(store.get("price") or store.get("base_price") or "N/A"),
+                            link=store.get("link", "N/A"),
+                        ))
+
+                await asyncio.gather(*[
+                    attach_stores(product, p["immersive_product_page_token"])
+                    for product, p in zip(products, raw_products)
+                    if p.get("immersive_product_page_token")
+                ])
+                return ShoppingResult(query=q, products=products)
 
             results = await asyncio.gather(*[handle_one(t) for t in targets], return_exceptions=True)
-            output = ""
-            for r, t in zip(results, targets):
-                if isinstance(r, Exception):
-                    output += f'## Google Shopping Results for "{t}"\n\nError: {str(r)}\n\n'
-                else:
-                    output += r
-
+            records = [
+                ShoppingResult(query=t, error=str(r)) if isinstance(r, Exception) else r
+                for r, t in zip(results, targets)
+            ]
+            output = render_shopping(records, TOOL_OUTPUT_FORMAT)
+
+            if session is not None:
+                session.record("google_shopping", served, fetched, len(output))
             return {"content": [{"type": "text", "text": output}]}
 
     except Exception as e:
         return {"content": [{"type": "text", "text": f"Google Shopping search failed: {str(e)}"}]}
+
+
+async def prefetch_shopping(session: ToolSession, queries: list[str]):
+    """投机预取：提前完成 google_shopping 的两步查询，结果留在 session 里等模型来取
+
+    只预取无价格过滤的查询（tbs 为空），失败静默忽略，真正调用时会重新请求；
+    预取是猜测，请求记在 session.prefetch_requests，不占本次请求的上游预算，避免挤掉模型真正的工具调用
+    """
+    api_key = os.environ.get("SERPAPI_KEY")
+    if not api_key:
+        return
+
+    async with httpx.AsyncClient(timeout=SHOPPING_TIMEOUT) as client:
+        async def get(params: dict) -> dict:
+            session.prefetch_requests += 1
+            return await _serpapi_get(client, params)
+
+        async def prefetch_one(q: str):
+            data, _ = await _cached(
+                SHOPPING_CACHE,
+                _shopping_key(q, ""),
+                lambda: get(_shopping_params(api_key, q, "")),
+                session,
+                count_upstream=False,
+            )
+            if data.get("error"):
+                return
+            tokens = [
+                p["immersive_product_page_token"]
+                for p in data.get("shopping_results", [])[:SHOPPING_MAX_PRODUCTS]
+                if p.get("immersive_product_page_token")
+            ]
+            await asyncio.gather(*[
+                _cached(
+                    PRODUCT_CACHE,
+                    token,
+                    functools.partial(get, _product_params(api_key, token)),
+                    session,
+                    count_upstream=False,
+                )
+                for token in tokens
+            ], return_exceptions=True)
+
+        await asyncio.gather(*[prefetch_one(q) for q in queries], return_exceptions=True)
+
+
+# ============================================================
+# 工具注册 - Tool Registration
+# ============================================================
+
+_TOOL_SPECS = {
+    "local_review_search": (LOCAL_REVIEW_SEARCH_DESCRIPTION, LOCAL_REVIEW_SEARCH_SCHEMA, _local_review_search),
+    "tavily_search": (TAVILY_SEARCH_DESCRIPTION, TAVILY_SEARCH_SCHEMA, _tavily_search),
+    "google_shopping": (GOOGLE_SHOPPING_DESCRIPTION, GOOGLE_SHOPPING_SCHEMA, _google_shopping),
+}
+
+# 无会话版本（单独调用 / 调试用）
+local_review_search = tool("local_review_search", LOCAL_REVIEW_SEARCH_DESCRIPTION, LOCAL_REVIEW_SEARCH_SCHEMA)(_local_review_search)
+tavily_search = tool("tavily_search", TAVILY_SEARCH_DESCRIPTION, TAVILY_SEARCH_SCHEMA)(_tavily_search)
+google_shopping = tool("google_shopping", GOOGLE_SHOPPING_DESCRIPTION, GOOGLE_SHOPPING_SCHEMA)(_google_shopping)
+
+
+def create_session_tools(session: ToolSession) -> dict[str, SdkMcpTool]:
+    """为一次对话创建绑定 session 的工具，按工具名索引"""
+    return {
+        name: tool(name, description, schema)(functools.partial(handler, session=session))
+        for name, (description, schema, handler) in _TOOL_SPECS.items()
+    }
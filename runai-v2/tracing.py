@@ -0,0 +1,265 @@
+"""RunAI LangSmith 追踪采样 - 按请求采样 / 只留失败和慢请求 / 有界队列后台导出
+[I N P U T]: config.py 的 LANGSMITH_* 配置，langsmith 的 trace / tracing_context
+[O U T P U T]: 对外提供 traced_request(), should_sample(), TraceHandle, TraceExporter, get_exporter()
+[P O S]: runai-v2/ 的可观测性层，包住 run_agent 的一次会话，决定这次会话的 trace 是否上报
+[P R O T O C O L]: 变更时更新此头部，然后检查 CLAUDE.md
+"""
+
+import atexit
+import hashlib
+import queue
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable
+
+from langsmith import Client, trace, tracing_context
+
+from config import (
+    LANGSMITH_EXPORT_QUEUE_SIZE,
+    LANGSMITH_FLUSH_TIMEOUT,
+    LANGSMITH_MAX_RUNS_PER_TRACE,
+    LANGSMITH_PROJECT,
+    LANGSMITH_SAMPLE_RATE,
+    LANGSMITH_SLOW_SECONDS,
+    LANGSMITH_TRACE_MODE,
+    logger,
+)
+
+TRACE_MODES = ("all", "tail", "off")
+
+
+def should_sample(key: Any = None, rate: float = LANGSMITH_SAMPLE_RATE) -> bool:
+    """按 rate 采样；给了 key（如评测用例 id）时按 str(key) 的哈希决定，同一用例每次运行结果一致
+
+    >>> should_sample(7, 0.5) == should_sample("7", 0.5)
+    True
+    """
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0:
+        return False
+    if key is None:
+        return random.random() < rate
+    bucket = int(hashlib.sha1(str(key).encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return bucket < rate
+
+
+# ============================================================
+# 后台导出 - Exporter
+# ============================================================
+
+class TraceExporter:
+    """有界队列 + 后台线程，把缓冲好的 trace 交给 LangSmith Client
+
+    队列元素是一个完整 trace 的 run 事件列表，队列满时整条 trace 丢弃（不会出现只有半棵树的 trace），
+    调用方只做 put_nowait；Client 的构造和网络请求都在后台线程
+    """
+
+    def __init__(self, client_factory: Callable[[], Any] | None = None, max_queue: int = LANGSMITH_EXPORT_QUEUE_SIZE):
+        self._client_factory = client_factory or _default_client
+        self._client = None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "dropped": 0, "exported_runs": 0, "failed_runs": 0}
+
+    def submit(self, calls: list[tuple[str, dict]]) -> bool:
+        """入队一个 trace，队列满时丢弃并返回 False"""
+        if not calls:
+            return True
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(calls)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["submitted"] += 1
+        return True
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            calls = self._queue.get()
+            try:
+                if calls is None:
+                    return
+                self._export(calls)
+            finally:
+                self._queue.task_done()
+
+    def _export(self, calls: list[tuple[str, dict]]):
+        if self._client is None:
+            try:
+                self._client = self._client_factory()
+            except Exception as e:
+                self.stats["failed_runs"] += len(calls)
+                logger.warning("Tracing | client init failed: %s", e)
+                return
+        for method, kwargs in calls:
+            try:
+                getattr(self._client, method)(**kwargs)
+                self.stats["exported_runs"] += 1
+            except Exception as e:
+                self.stats["failed_runs"] += 1
+                logger.debug("Tracing | %s failed: %s", method, e)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout: float = LANGSMITH_FLUSH_TIMEOUT) -> bool:
+        """等待队列清空并让 Client 发完批次，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self._client is not None and hasattr(self._client, "flush"):
+            try:
+                self._client.flush()
+            except Exception as e:
+                logger.debug("Tracing | client flush failed: %s", e)
+        return not self._queue.unfinished_tasks
+
+    def close(self, timeout: float = LANGSMITH_FLUSH_TIMEOUT):
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put(None, timeout=1.0)
+        except queue.Full:
+            return
+        self._thread.join(timeout=1.0)
+        self._thread = None
+
+
+def _default_client():
+    from langsmith import Client
+    return Client()
+
+
+_exporter: TraceExporter | None = None
+
+
+def get_exporter() -> TraceExporter:
+    """进程内共享的导出器，退出前刷完队列"""
+    global _exporter
+    if _exporter is None:
+        _exporter = TraceExporter()
+        atexit.register(_exporter.close)
+    return _exporter
+
+
+# ============================================================
+# 请求级追踪 - Per-request tracing
+# ============================================================
+
+class _TraceBuffer(Client):
+    """只改写 create_run / update_run 的 LangSmith Client：记录下来，请求结束时再决定是否导出
+
+    会话内所有子 run（模型轮次、工具调用、@traceable 函数）都继承根 run 的 client，因此整棵树都会进这个缓冲；
+    langsmith 读取的其他 Client 属性（otel_exporter 等）照常由父类提供。关闭自动批量上报，不启动后台线程
+    """
+
+    def __init__(self, max_calls: int = LANGSMITH_MAX_RUNS_PER_TRACE):
+        super().__init__(auto_batch_tracing=False)
+        self.calls: list[tuple[str, dict]] = []
+        self.max_calls = max_calls
+        self.overflow = 0
+
+    def _add(self, method: str, kwargs: dict):
+        if len(self.calls) < self.max_calls:
+            self.calls.append((method, kwargs))
+        else:
+            self.overflow += 1
+
+    def create_run(self, **kwargs):
+        self._add("create_run", kwargs)
+
+    def update_run(self, **kwargs):
+        self._add("update_run", kwargs)
+
+
+@dataclass
+class TraceHandle:
+    """traced_request 交给调用方的句柄：标记失败、写入输出"""
+    sampled: bool
+    failed: str = ""
+    run: Any = field(default=None, repr=False)
+
+    def mark_failed(self, reason: str):
+        """标记为失败（异常会自动标记），tail 模式下失败请求一定上报"""
+        self.failed = self.failed or reason
+
+    def set_outputs(self, outputs: dict):
+        if self.run is not None:
+            self.run.end(outputs=outputs)
+
+
+@asynccontextmanager
+async def traced_request(
+    name: str,
+    inputs: dict,
+    key: str | None = None,
+    mode: str = LANGSMITH_TRACE_MODE,
+    rate: float = LANGSMITH_SAMPLE_RATE,
+    slow_seconds: float = LANGSMITH_SLOW_SECONDS,
+    exporter: TraceExporter | None = None,
+) -> AsyncIterator[TraceHandle]:
+    """把一次会话包成一个 LangSmith trace
+
+    - off 或未被采样：关闭追踪上下文，会话内不创建任何 run
+    - all：会话结束后整条 trace 入队导出
+    - tail：只有失败（异常 / mark_failed）或耗时超过 slow_seconds 的 trace 入队，其余直接丢弃
+
+    会话内的 @traceable 函数在各模式下都能正常运行：
+
+    >>> import asyncio
+    >>> from langsmith import traceable
+    >>> @traceable
+    ... def child(x):
+    ...     return x + 1
+    >>> async def session(mode):
+    ...     sink = []
+    ...     exporter = TraceExporter(client_factory=lambda: None)
+    ...     exporter.submit = lambda calls: sink.append(calls) or True
+    ...     async with traced_request("doctest", {}, mode=mode, rate=1.0, exporter=exporter) as handle:
+    ...         result = child(1)
+    ...         handle.mark_failed("doctest")
+    ...     return result, [method for calls in sink for method, _ in calls]
+    >>> for mode in TRACE_MODES:
+    ...     print(mode, asyncio.run(session(mode)))
+    all (2, ['create_run', 'create_run', 'update_run', 'update_run'])
+    tail (2, ['create_run', 'create_run', 'update_run', 'update_run'])
+    off (2, [])
+    """
+    if mode == "off" or not should_sample(key, rate):
+        with tracing_context(enabled=False):
+            yield TraceHandle(sampled=False)
+        return
+
+    buffer = _TraceBuffer()
+    handle = TraceHandle(sampled=True)
+    started = time.perf_counter()
+    try:
+        with tracing_context(enabled=True, client=buffer, project_name=LANGSMITH_PROJECT):
+            async with trace(name, run_type="chain", inputs=inputs,
+                             metadata={"trace_key": key, "trace_mode": mode, "sample_rate": rate}) as run:
+                handle.run = run
+                try:
+                    yield handle
+                except BaseException as e:
+                    handle.mark_failed(type(e).__name__)
+                    raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if mode == "all" or handle.failed or elapsed >= slow_seconds:
+            if buffer.overflow:
+                logger.warning("Tracing | %s dropped %d run events over the per-trace cap", name, buffer.overflow)
+            (exporter or get_exporter()).submit(buffer.calls)